@@ -34,24 +34,30 @@
 # Setup
 # -----------------------------------------------------------------------------
 # If you do not have these installed, run:
-#   pip install openai pydantic pandas numpy scikit-learn
+#   pip install openai pydantic pandas numpy scikit-learn pyarrow orjson tiktoken
 #
 # Optional (nice-to-have):
 #   pip install python-dateutil
 
 import os
 import json
+import time
+import hashlib
+import orjson
+import tiktoken
 import numpy as np
 import pandas as pd
 
-from datetime import date
+from datetime import date, datetime, timezone
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from pydantic import BaseModel, Field
-from typing import List, Literal, Optional
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Literal, Optional, get_args
 
-from sklearn.metrics import classification_report
+from sklearn.metrics import precision_recall_fscore_support
 
-from openai import OpenAI
+from openai import OpenAI, APIError
 
 # Reproducibility (for sampling / splitting / ordering in this script)
 np.random.seed(123)
@@ -230,6 +236,15 @@ print(docs_df.head())
 #
 # We use Structured Outputs, so the model is constrained to the Pydantic schema,
 # but prompts still matter for meaning, missingness, and evidence quality.
+#
+# Prompt layout also matters for cost. OpenAI caches the beginning ("prefix")
+# of recent prompts: when a new request starts with exactly the same text, that
+# part is billed at a discount and processed faster. So we keep everything that
+# is the same for every document (the system prompt and the schema) first and
+# byte-for-byte identical: a plain string, with no dates, ids, or other values
+# pasted in. Anything that changes per document goes only in the user message.
+# (Caching applies once that shared prefix is at least ~1,024 tokens, which a
+# longer codebook-style system prompt easily reaches.)
 
 system_prompt = (
     "You are an expert research assistant. "
@@ -239,6 +254,15 @@ system_prompt = (
     "Always provide evidence quotes for event_type, date, location, actors, and outcome."
 )
 
+# The per-document user message is a fixed template; {doc_id} and {text} are
+# filled in for each document with user_prompt_template.format(...). Keeping
+# it next to the system prompt means every word we send lives in one place.
+user_prompt_template = (
+    "Document ID: {doc_id}\n\n"
+    "Text:\n{text}\n\n"
+    "Return exactly one extracted record."
+)
+
 # -----------------------------------------------------------------------------
 # Part 4: LLM Structured Extraction (Batch Processing)
 # -----------------------------------------------------------------------------
@@ -247,50 +271,359 @@ system_prompt = (
 # - you may batch requests
 # - you may chunk long documents and aggregate
 #
-# This example uses OpenAI Structured Outputs parsing.
+# This example uses OpenAI Structured Outputs (replies constrained to our schema).
+#
+# Each API call spends almost all of its time waiting on the network, so we
+# send several documents at once instead of waiting for each reply in turn:
+# - ThreadPoolExecutor runs up to max_concurrency calls at the same time
+#   (keep this modest so you stay under your account's rate limits)
+# - executor.submit(...) starts one call and returns a "future" right away
+# - as_completed(...) hands us each future as soon as its reply arrives, and
+#   future.result() gives us that reply
+# Each reply is saved to disk the moment it arrives (see Caching below), so
+# if the run stops halfway (network error, rate limit, Ctrl+C), every finished
+# extraction is kept and the next run only sends the missing documents.
+#
+# Caching: re-running the script should not pay for the same extraction twice.
+# Each request gets a cache key: a SHA-256 hash of everything that determines
+# the answer (model, system prompt, user prompt, and the JSON schema). Results
+# are saved as cache/llm_extractions/<key>.json, so:
+# - unchanged documents are read from disk instead of calling the API
+# - editing the prompt, the schema, or a document's text changes its key,
+#   so only those documents are sent again
+# - each result has a <key>.meta.json file recording when it was created
+# Delete the cache folder to force fresh extractions.
 
 client = OpenAI()
 
-model_name = "gpt-4o-2024-08-06"
+# Model cascade (cheap first, strong only where needed):
+# - every document is first extracted with cheap_model (a fraction of the
+#   price and much faster)
+# - documents whose cheap extraction looks shaky (confidence below
+#   escalation_confidence, any uncertainty flag, or no valid result at all)
+#   are extracted again with strong_model, whose result replaces the cheap one
+# - the extraction_model column records which model produced each final row,
+#   so audits can compare failure modes by model
+cheap_model = "gpt-4o-mini"
+strong_model = "gpt-4o-2024-08-06"
+escalation_confidence = 0.70
+
+max_concurrency = 10
+
+# Requests with the same prompt_cache_key are routed together, which raises the
+# chance that our shared prefix is found in OpenAI's prompt cache.
+prompt_cache_key = "llm_human_event_extraction"
+
+# Build the schema once, in the raw JSON form the API receives, and reuse it
+# for every call (and for the Batch API file in Part 4b). Passing
+# text_format=EventExtraction instead would make the SDK convert the Pydantic
+# class to JSON Schema again on every call.
+#
+# Strict mode (the API guarantees the reply matches the schema) needs, for every
+# object in the schema (EventExtraction itself and EvidenceSpan under "$defs"):
+# - additionalProperties: false (no fields beyond the ones we defined)
+# - every property listed under "required" (optional fields are still present,
+#   as null)
+# - no "default" values
+event_schema = EventExtraction.model_json_schema()
+
+for object_schema in [event_schema] + list(event_schema["$defs"].values()):
+    object_schema["additionalProperties"] = False
+    object_schema["required"] = list(object_schema["properties"])
+    for property_schema in object_schema["properties"].values():
+        property_schema.pop("default", None)
+
+event_text_format = {
+    "type": "json_schema",
+    "name": "EventExtraction",
+    "schema": event_schema,
+    "strict": True,
+}
+
+# The reply text is JSON; this checks it against the schema and returns an
+# EventExtraction object
+validate_extraction = EventExtraction.model_validate_json
+
+user_prompts = [
+    user_prompt_template.format(doc_id=doc_id, text=text)
+    for doc_id, text in zip(docs_df["doc_id"], docs_df["text"])
+]
 
-extractions = []
+cache_dir = "cache/llm_extractions"
+os.makedirs(cache_dir, exist_ok=True)
+
+requests_df = pd.DataFrame({
+    "doc_id": docs_df["doc_id"],
+    "user_prompt": user_prompts,
+})
+
+# Near-duplicate documents (semantic cache):
+# News corpora often contain the same story several times (wire copy, light
+# rewrites). The exact cache above only helps when the text is identical, so
+# we also compare documents by meaning:
+# - an embedding model turns each text into a vector; texts with similar
+#   meaning get vectors pointing in similar directions
+# - cosine similarity (dot product of unit-length vectors) measures this,
+#   from about 0 (unrelated) to 1 (same meaning)
+# - a document that is at least semantic_threshold similar to an earlier
+#   document reuses that document's extraction instead of calling the LLM
+# Reused rows are flagged for human review in Part 5, because a rewrite can
+# still differ in details (date, place) that the reused record gets wrong.
+embedding_model = "text-embedding-3-small"
+semantic_threshold = 0.95
+
+# Embeddings are cached next to the extractions, keyed by a hash of the
+# embedding model and the text, so a rerun only pays for texts it has not seen.
+embedding_paths = [
+    os.path.join(
+        cache_dir,
+        hashlib.sha256(json.dumps([embedding_model, text]).encode("utf-8")).hexdigest() + ".embedding.npy"
+    )
+    for text in docs_df["text"]
+]
+missing_paths = [path for path in embedding_paths if not os.path.exists(path)]
+missing_texts = [text for text, path in zip(docs_df["text"], embedding_paths) if not os.path.exists(path)]
+
+# One embeddings call per 2,048 uncached texts (the API's limit per request);
+# when everything is cached, the loop body never runs and nothing is sent.
+embedding_batch_size = 2048
+for start in range(0, len(missing_texts), embedding_batch_size):
+    embedding_response = client.embeddings.create(
+        model=embedding_model,
+        input=missing_texts[start:start + embedding_batch_size]
+    )
+    for path, item in zip(missing_paths[start:start + embedding_batch_size], embedding_response.data):
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, np.array(item.embedding))
+        os.replace(path + ".tmp", path)
 
-print("\n------------------------------")
-print("Running LLM extraction (one doc at a time)")
-print("------------------------------")
+doc_embeddings = np.array([np.load(path) for path in embedding_paths])
+doc_embeddings = doc_embeddings / np.linalg.norm(doc_embeddings, axis=1, keepdims=True)
 
-for i in range(len(docs_df)):
-    doc_id = docs_df.loc[i, "doc_id"]
-    text = docs_df.loc[i, "text"]
+# Cosine similarity of every pair of documents (one row and column per document)
+doc_similarity = doc_embeddings @ doc_embeddings.T
 
-    user_prompt = (
-        f"Document ID: {doc_id}\n\n"
-        f"Text:\n{text}\n\n"
-        "Return exactly one extracted record."
-    )
+# For each document, the first document (an earlier one, or itself) that is
+# similar enough: np.tril keeps only "itself or earlier" pairs, and argmax
+# returns the position of the first True in each row.
+source_idx = np.tril(doc_similarity >= semantic_threshold).argmax(axis=1)
 
-    response = client.responses.parse(
-        model=model_name,
-        input=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        text_format=EventExtraction,
-    )
+requests_df["source_doc_id"] = requests_df["doc_id"].to_numpy()[source_idx]
 
-    extracted = response.output_parsed
-    extra_dict = extracted.model_dump()
-    extra_dict["raw_text"] = text
+print("\n------------------------------")
+print(f"Running LLM extraction (up to {max_concurrency} docs at a time)")
+print(f"{(source_idx != np.arange(len(requests_df))).sum()} of {len(requests_df)} docs reuse the extraction of a near-duplicate")
+print("------------------------------")
 
-    extra_dict["evidence_json"] = json.dumps(extra_dict["evidence"], ensure_ascii=False)
-    extra_dict["uncertainty_flags_json"] = json.dumps(extra_dict["uncertainty_flags"], ensure_ascii=False)
+# Rate limits (token bucket):
+# Your account may send at most requests_per_minute requests and
+# tokens_per_minute tokens per minute. Sending faster only earns "429 Too Many
+# Requests" errors and forced waits, so we pace ourselves:
+# - keep two "buckets" of allowance (requests and tokens) that refill steadily,
+#   up to one minute's worth
+# - before each request, estimate its size in tokens with tiktoken (the
+#   model's own tokenizer) and wait just long enough for both buckets to cover it
+# - then take the request and its tokens out of the buckets
+# Set the two limits to the values shown for your account and model.
+#
+# Retries (so one bad reply does not crash the whole run):
+# - Network problems and any remaining rate-limit errors (HTTP 429) are retried
+#   by the OpenAI client itself, with doubling waits (OpenAI(max_retries=...)).
+# - A reply can still fail our Pydantic checks (e.g., a confidence above 1).
+#   We then send that document again, adding the bad reply and the error
+#   message to the conversation so the model can correct itself.
+# - Each attempt only sends documents that are not in the cache yet, so we
+#   make at most max_attempts passes and documents that worked are never resent.
+# - Documents that still fail are written to outputs/extraction_failures.jsonl
+#   for a human to look at, and the rest of the script carries on without them.
+#
+# Save each new result to the cache as soon as it arrives. Writing to a
+# temporary file and then renaming it means an interrupted run never leaves a
+# half-written cache entry behind.
+# itertuples() hands us each row as a lightweight tuple with named fields
+# (row.doc_id, row.cache_path, ...), much faster than looking values up with .loc.
+
+max_attempts = 3
+
+requests_per_minute = 500
+tokens_per_minute = 30000
+
+# Rough allowance for the reply's tokens (the extracted record)
+expected_output_tokens = 400
+
+token_encoding = tiktoken.encoding_for_model(cheap_model)
+schema_text = json.dumps(event_text_format)
+
+# Both buckets start full
+available_requests = requests_per_minute
+available_tokens = tokens_per_minute
+last_refill = time.monotonic()
+
+# Most recent error for each document that failed an attempt, by doc_id
+failures = {}
+
+# Which documents the current model should extract (the first model: all)
+requests_df["escalate"] = True
+
+# Cache file holding each document's final result, and the model behind it
+requests_df["final_cache_path"] = ""
+requests_df["extraction_model"] = ""
+
+for model_name in [cheap_model, strong_model]:
+    # This model's cache files. The key includes the model name, so each
+    # model's results are cached (and kept) separately.
+    cache_keys = [
+        hashlib.sha256(
+            json.dumps([model_name, system_prompt, user_prompt, event_text_format], sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        for user_prompt in user_prompts
+    ]
+    requests_df["cache_path"] = [os.path.join(cache_dir, key + ".json") for key in cache_keys]
+    requests_df["meta_path"] = [os.path.join(cache_dir, key + ".meta.json") for key in cache_keys]
+    requests_df["source_cache_path"] = requests_df["cache_path"].to_numpy()[source_idx]
+
+    print(f"\n{model_name}: {requests_df['escalate'].sum()} docs to extract "
+          f"({(requests_df['escalate'] & requests_df['cache_path'].map(os.path.exists)).sum()} found in {cache_dir})")
+
+    # Extra messages (bad reply + correction request) to send next time, by doc_id
+    feedback = {}
+
+    for attempt in range(1, max_attempts + 1):
+        # Only source documents (those another document, or itself, takes its
+        # extraction from) that this model should extract and that have no
+        # cached result go to the API
+        to_fetch = requests_df[
+            requests_df["escalate"]
+            & requests_df["doc_id"].isin(requests_df["source_doc_id"])
+            & ~requests_df["cache_path"].map(os.path.exists)
+        ]
+        print(f"Attempt {attempt}: sending {len(to_fetch)} docs")
+
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            # A dict from each future to the row it belongs to
+            futures = {}
+
+            for row in to_fetch.itertuples(index=False):
+                request_messages = [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": row.user_prompt},
+                ] + feedback.get(row.doc_id, [])
+
+                request_tokens = len(token_encoding.encode(
+                    schema_text + "".join(message["content"] for message in request_messages)
+                )) + expected_output_tokens
+
+                # Refill both buckets for the time since we last updated them
+                now = time.monotonic()
+                available_requests = min(requests_per_minute, available_requests + (now - last_refill) * requests_per_minute / 60)
+                available_tokens = min(tokens_per_minute, available_tokens + (now - last_refill) * tokens_per_minute / 60)
+
+                # Wait until both buckets cover this request (0 seconds if they already do)
+                wait_seconds = max(
+                    0.0,
+                    (1 - available_requests) * 60 / requests_per_minute,
+                    (request_tokens - available_tokens) * 60 / tokens_per_minute,
+                )
+                time.sleep(wait_seconds)
+
+                # The buckets refilled while we waited; now take this request out
+                available_requests = available_requests + wait_seconds * requests_per_minute / 60 - 1
+                available_tokens = available_tokens + wait_seconds * tokens_per_minute / 60 - request_tokens
+                last_refill = now + wait_seconds
+
+                future = executor.submit(
+                    client.responses.create,
+                    model=model_name,
+                    input=request_messages,
+                    text={"format": event_text_format},
+                    prompt_cache_key=prompt_cache_key,
+                )
+                futures[future] = row
+
+            # Validation and cache writes run here, in the main thread, while
+            # the worker threads are still waiting on the API. So this CPU work
+            # never holds back requests that are already in flight.
+            for future in as_completed(futures):
+                row = futures[future]
+
+                try:
+                    response = future.result()
+                    extracted = validate_extraction(response.output_text)
+
+                    with open(row.cache_path + ".tmp", "w", encoding="utf-8") as f:
+                        f.write(extracted.model_dump_json())
+                    os.replace(row.cache_path + ".tmp", row.cache_path)
+
+                    with open(row.meta_path, "w", encoding="utf-8") as f:
+                        json.dump({
+                            "doc_id": row.doc_id,
+                            "model": model_name,
+                            "attempt": attempt,
+                            "created_utc": datetime.now(timezone.utc).isoformat(),
+                        }, f)
+
+                except ValidationError as err:
+                    feedback[row.doc_id] = [
+                        {"role": "assistant", "content": response.output_text},
+                        {"role": "user", "content": f"Your previous output failed validation: {err}. Re-emit ONLY valid JSON matching the schema."},
+                    ]
+                    failures[row.doc_id] = {"doc_id": row.doc_id, "model": model_name, "attempt": attempt, "error": str(err)}
+
+                except APIError as err:
+                    failures[row.doc_id] = {"doc_id": row.doc_id, "model": model_name, "attempt": attempt, "error": repr(err)}
+
+    # Documents this model extracted (directly or through their source) now
+    # take this model's result as their final result
+    stage_done = requests_df["escalate"] & requests_df["source_cache_path"].map(os.path.exists)
+    requests_df["final_cache_path"] = requests_df["source_cache_path"].where(stage_done, requests_df["final_cache_path"])
+    requests_df["extraction_model"] = requests_df["extraction_model"].mask(stage_done, model_name)
+
+    # Escalate (for the next model) documents with no result yet, or whose
+    # result has low confidence or any uncertainty flag
+    has_result = requests_df["final_cache_path"] != ""
+    final_records = [
+        validate_extraction(Path(cache_path).read_text(encoding="utf-8"))
+        for cache_path in requests_df.loc[has_result, "final_cache_path"]
+    ]
+    requests_df["escalate"] = True
+    requests_df.loc[has_result, "escalate"] = [
+        (record.extraction_confidence < escalation_confidence) or (len(record.uncertainty_flags) > 0)
+        for record in final_records
+    ]
 
-    extra_dict.pop("evidence")
-    extra_dict.pop("uncertainty_flags")
+# Documents that have a final result
+done = requests_df[requests_df["final_cache_path"] != ""]
 
-    extractions.append(extra_dict)
+# Read every finished document's result (new, cached, or reused) from the cache
+parsed = [
+    validate_extraction(Path(cache_path).read_text(encoding="utf-8"))
+    for cache_path in done["final_cache_path"]
+]
 
-extractions_df = pd.DataFrame(extractions)
+# Build the table column by column:
+# - one row per document from the parsed records
+# - evidence and uncertainty_flags are lists, so we store them as JSON strings
+#   (one text cell each) and drop the list columns
+# - orjson.dumps is a much faster JSON encoder than json.dumps; it returns
+#   UTF-8 bytes, which .str.decode("utf-8") turns back into text
+extractions_df = pd.DataFrame([extracted.model_dump() for extracted in parsed])
+extractions_df["evidence_json"] = extractions_df["evidence"].map(orjson.dumps).str.decode("utf-8")
+extractions_df["uncertainty_flags_json"] = extractions_df["uncertainty_flags"].map(orjson.dumps).str.decode("utf-8")
+extractions_df = extractions_df.drop(columns=["evidence", "uncertainty_flags"])
+
+# Reused records carry their source's doc_id, so we set every row's doc_id to
+# the document it stands for, and record where its extraction came from
+extractions_df["doc_id"] = done["doc_id"].to_numpy()
+extractions_df["source_doc_id"] = done["source_doc_id"].to_numpy()
+extractions_df["extraction_model"] = done["extraction_model"].to_numpy()
+
+# event_type and geo_precision can only take the few values listed in Part 1,
+# so we store them as pandas categoricals: each row keeps a small integer code
+# instead of its own copy of the string, which saves memory and makes
+# comparisons like .isin() faster. get_args() reads the allowed values from
+# the Literal types, so the categories always match the schema.
+extractions_df["event_type"] = pd.Categorical(extractions_df["event_type"], categories=list(get_args(EventType)))
+extractions_df["geo_precision"] = pd.Categorical(extractions_df["geo_precision"], categories=list(get_args(GeoPrecision)))
 
 print("\n------------------------------")
 print("Extracted records (first 5 rows)")
@@ -298,8 +631,70 @@ print("------------------------------")
 print(extractions_df.head())
 
 # Save raw extractions (for traceability)
+# Intermediate tables are saved as Parquet: a compact binary, column-by-column
+# format that is much faster to write and read back than CSV, and that keeps
+# column types (categoricals, booleans, lists) intact. Read them back with
+# pd.read_parquet(...). Only the audit sheet (Part 6), which people open in a
+# spreadsheet, is saved as CSV.
 os.makedirs("outputs", exist_ok=True)
-extractions_df.to_csv("outputs/extractions_raw.csv", index=False)
+extractions_df.to_parquet("outputs/extractions_raw.parquet", engine="pyarrow", compression="snappy", index=False)
+
+# Save documents that failed every attempt (empty file when all succeeded).
+# A near-duplicate fails when its source document failed, so each line holds
+# the source's error plus the doc_id it affects.
+failed_docs = requests_df[~requests_df.index.isin(done.index)]
+
+with open("outputs/extraction_failures.jsonl", "w", encoding="utf-8") as f:
+    f.writelines(
+        json.dumps({**failures[row.source_doc_id], "doc_id": row.doc_id}, ensure_ascii=False) + "\n"
+        for row in failed_docs.itertuples(index=False)
+    )
+
+print(f"{len(failed_docs)} docs failed all {max_attempts} attempts (see outputs/extraction_failures.jsonl)")
+
+# -----------------------------------------------------------------------------
+# Part 4b: The Same Requests as a Batch API File (large, non-urgent runs)
+# -----------------------------------------------------------------------------
+# For big corpora you rarely need answers within seconds. OpenAI's Batch API
+# takes a JSONL file (one request per line), processes it within 24 hours, and
+# charges about half the price of the calls above (with separate, higher rate
+# limits). Here we write that file for our corpus:
+# - custom_id lets you match each result back to its document
+# - body holds exactly what we sent above, including the prebuilt schema
+#
+# To submit it and collect the results later:
+#   batch_file = client.files.create(file=open("outputs/batch_input.jsonl", "rb"), purpose="batch")
+#   batch = client.batches.create(input_file_id=batch_file.id, endpoint="/v1/responses", completion_window="24h")
+#   # ...later, once client.batches.retrieve(batch.id).status is "completed":
+#   batch = client.batches.retrieve(batch.id)
+#   batch_results = client.files.content(batch.output_file_id).text.splitlines()
+#   # each result line holds "custom_id" and "response" -> "body" -> "output";
+#   # the output message's text is JSON you can check with
+#   # validate_extraction(...)
+
+batch_lines = [
+    json.dumps(
+        {
+            "custom_id": doc_id,
+            "method": "POST",
+            "url": "/v1/responses",
+            "body": {
+                "model": cheap_model,
+                "input": [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ],
+                "text": {"format": event_text_format},
+                "prompt_cache_key": prompt_cache_key,
+            },
+        },
+        ensure_ascii=False
+    )
+    for doc_id, user_prompt in zip(docs_df["doc_id"], user_prompts)
+]
+
+with open("outputs/batch_input.jsonl", "w", encoding="utf-8") as f:
+    f.write("\n".join(batch_lines) + "\n")
 
 # -----------------------------------------------------------------------------
 # Part 5: Uncertainty Checks (Automatic Flags for Human Review)
@@ -309,25 +704,33 @@ extractions_df.to_csv("outputs/extractions_raw.csv", index=False)
 # - Add mechanical checks (missing date, missing country, etc.)
 # - Use these checks to decide what gets spot-audited
 
-# Convert confidence to numeric (safety)
-extractions_df["extraction_confidence"] = pd.to_numeric(extractions_df["extraction_confidence"], errors="coerce")
-
 # Simple mechanical checks (vectorized; no if/else)
-extractions_df["flag_low_confidence"] = extractions_df["extraction_confidence"] < 0.70
-extractions_df["flag_missing_date"] = extractions_df["event_date_iso"].isna()
-extractions_df["flag_missing_country"] = extractions_df["country"].isna()
-extractions_df["flag_geo_unknown"] = extractions_df["geo_precision"].isin(["unknown", "country_only"])
+# np.column_stack puts the True/False checks side by side in one NumPy
+# array (one row per document, one column per check).
+# flag_semantic_reuse marks records copied from a near-duplicate (Part 4).
+# geo_precision is a categorical (Part 4), so we compare its small integer
+# codes with the codes of "unknown" and "country_only" instead of the strings.
+geo_review_codes = extractions_df["geo_precision"].cat.categories.get_indexer(["unknown", "country_only"])
+
+flag_cols = ["flag_low_confidence", "flag_missing_date", "flag_missing_country", "flag_geo_unknown", "flag_semantic_reuse"]
+flags = np.column_stack([
+    extractions_df["extraction_confidence"].to_numpy() < escalation_confidence,
+    extractions_df["event_date_iso"].isna().to_numpy(),
+    extractions_df["country"].isna().to_numpy(),
+    np.isin(extractions_df["geo_precision"].cat.codes.to_numpy(), geo_review_codes),
+    (extractions_df["source_doc_id"] != extractions_df["doc_id"]).to_numpy(),
+])
+extractions_df[flag_cols] = flags
 
-# If any flags are true, mark for review
-flag_cols = ["flag_low_confidence", "flag_missing_date", "flag_missing_country", "flag_geo_unknown"]
-extractions_df["needs_human_review"] = extractions_df[flag_cols].any(axis=1)
+# If any flags are true, mark for review (any() across each row of the array)
+extractions_df["needs_human_review"] = flags.any(axis=1)
 
 print("\n------------------------------")
 print("Review flag counts")
 print("------------------------------")
 print(extractions_df[flag_cols + ["needs_human_review"]].sum(numeric_only=True))
 
-extractions_df.to_csv("outputs/extractions_with_flags.csv", index=False)
+extractions_df.to_parquet("outputs/extractions_with_flags.parquet", engine="pyarrow", compression="snappy", index=False)
 
 # -----------------------------------------------------------------------------
 # Part 6: Human Validation / Spot-Audits (Create an Audit Sheet)
@@ -340,20 +743,33 @@ extractions_df.to_csv("outputs/extractions_with_flags.csv", index=False)
 # - includes extracted fields + raw_text + evidence
 # - includes blank columns for human corrections / notes
 
+# We pick documents by doc_id first (a set union removes duplicates: a doc can
+# be both randomly sampled and flagged), then pull those rows once.
 audit_random_n = 5
-audit_random = extractions_df.sample(n=audit_random_n, random_state=123)
+audit_random_ids = set(extractions_df["doc_id"].sample(n=audit_random_n, random_state=123))
 
-audit_flagged = extractions_df[extractions_df["needs_human_review"]].copy()
+audit_flagged_ids = set(extractions_df.loc[extractions_df["needs_human_review"], "doc_id"])
 
-audit_sheet = pd.concat([audit_random, audit_flagged], ignore_index=True).drop_duplicates(subset=["doc_id"])
-audit_sheet = audit_sheet.sort_values("doc_id").reset_index(drop=True)
+audit_ids = sorted(audit_random_ids | audit_flagged_ids)
+audit_sheet = extractions_df.set_index("doc_id").loc[audit_ids].reset_index()
 
-audit_sheet["human_is_correct"] = ""          # fill with 1/0
-audit_sheet["human_correct_event_type"] = ""  # optional correction
-audit_sheet["human_correct_date_iso"] = ""    # optional correction
-audit_sheet["human_correct_location"] = ""    # optional correction (free text)
-audit_sheet["failure_mode"] = ""              # e.g., date_missing, location_vague, actor_hallucination
-audit_sheet["reviewer_notes"] = ""            # free text
+# The extraction tables do not repeat each document's text (it already lives
+# in docs_df); we join it back in only here, where reviewers need it
+audit_sheet = audit_sheet.merge(
+    docs_df[["doc_id", "text"]].rename(columns={"text": "raw_text"}),
+    on="doc_id",
+    how="left"
+)
+
+# Blank columns for reviewers, added in one step
+audit_sheet = audit_sheet.assign(
+    human_is_correct="",          # fill with 1/0
+    human_correct_event_type="",  # optional correction
+    human_correct_date_iso="",    # optional correction
+    human_correct_location="",    # optional correction (free text)
+    failure_mode="",              # e.g., date_missing, location_vague, actor_hallucination
+    reviewer_notes="",            # free text
+)
 
 audit_sheet.to_csv("outputs/human_audit_sheet.csv", index=False)
 
@@ -385,12 +801,54 @@ gold = pd.DataFrame([
 eval_df = gold.merge(extractions_df[["doc_id", "event_type"]], on="doc_id", how="left")
 eval_df = eval_df.rename(columns={"event_type": "event_type_pred"})
 
+# A gold document with no extraction (it failed every attempt in Part 4) counts
+# as a wrong prediction rather than being silently dropped
+eval_df["event_type_pred"] = eval_df["event_type_pred"].cat.add_categories("missing").fillna("missing")
+
 print("\n------------------------------")
 print("Evaluation table (gold vs predicted)")
 print("------------------------------")
 print(eval_df)
 
+# Precision/recall by class:
+# The event types are fixed in Part 1, so we turn gold and predicted labels into
+# integer codes over that list once and pass the full label list to sklearn
+# (no label discovery, and every event type gets a row even if it never occurs).
+# A "missing" prediction has no code in the list (-1), so it counts as wrong.
+event_labels = list(get_args(EventType))
+y_true = pd.Categorical(eval_df["event_type_gold"], categories=event_labels).codes
+y_pred = pd.Categorical(eval_df["event_type_pred"], categories=event_labels).codes
+
+precision, recall, f1, support = precision_recall_fscore_support(
+    y_true, y_pred, labels=np.arange(len(event_labels)), zero_division=0
+)
+
+report_df = pd.DataFrame(
+    {"precision": precision, "recall": recall, "f1": f1, "support": support},
+    index=event_labels,
+)
+
+# Summary rows, as in sklearn's classification_report:
+# - macro avg: plain mean over the event types that occur in the gold or
+#   predicted labels (every such type counts the same)
+# - weighted avg: mean weighted by each type's support (gold count)
+occurs = np.isin(np.arange(len(event_labels)), np.concatenate([y_true, y_pred]))
+report_df.loc["macro avg"] = [
+    precision[occurs].mean(),
+    recall[occurs].mean(),
+    f1[occurs].mean(),
+    support.sum(),
+]
+report_df.loc["weighted avg"] = [
+    np.average(precision, weights=support),
+    np.average(recall, weights=support),
+    np.average(f1, weights=support),
+    support.sum(),
+]
+report_df["support"] = report_df["support"].astype(int)
+
 print("\n------------------------------")
 print("Classification report (event_type)")
 print("------------------------------")
-print(classification_report(eval_df["event_type_gold"], eval_df["event_type_pred"]))
+print(report_df.round(2))
+print(f"\naccuracy: {(y_true == y_pred).mean():.2f} (n={len(y_true)})")
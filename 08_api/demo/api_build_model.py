@@ -22,7 +22,7 @@
 # Setup
 # -----------------------------------------------------------------------------
 # If you do not have these installed, run (in Terminal / Anaconda Prompt):
-#   pip install pandas numpy matplotlib statsmodels fredapi pyreadr plotly lxml requests
+#   pip install pandas numpy scipy matplotlib patsy fredapi joblib pyreadr plotly lxml requests
 
 import re
 import numpy as np
@@ -30,11 +30,15 @@ import pandas as pd
 import matplotlib.pyplot as plt
 
 from datetime import date
-import statsmodels.formula.api as smf
+import patsy
+from scipy.linalg import solve_triangular
 
 # FRED API wrapper
 from fredapi import Fred
 
+# On-disk cache for function results (used for the FRED downloads)
+from joblib import Memory
+
 # For reading .rds (RDS) files in Python (state-level poll/census data)
 import pyreadr
 
@@ -46,17 +50,22 @@ import plotly.express as px
 # Part 1: Presidential vote data (national-level)
 # -----------------------------------------------------------------------------
 # Read in the presidential election vote data
-vote_data = pd.read_csv("votes/1976-2020-president.csv")
+# Low-cardinality text columns are stored as "category" (integer codes plus a
+# small lookup table) instead of one Python string object per row.
+vote_data = pd.read_csv(
+    "votes/1976-2020-president.csv",
+    dtype={"candidate": "category", "party_detailed": "category", "state_po": "category"}
+)
 
 # Keep only Democrat and Republican votes
 vote_data = vote_data[
     vote_data["party_detailed"].isin(["DEMOCRAT", "REPUBLICAN"])
-].copy()
+]
 
 # Summarize votes by year, candidate, party (mimics ddply summarize in R)
 vote_data = (
     vote_data
-    .groupby(["year", "candidate", "party_detailed"], as_index=False)
+    .groupby(["year", "candidate", "party_detailed"], as_index=False, observed=True)
     .agg(
         candidatevotes=("candidatevotes", "sum"),
         totalvotes=("totalvotes", "sum")
@@ -69,6 +78,11 @@ vote_data = vote_data[
     (vote_data["candidate"].notna())
 ].copy()
 
+# Drop category levels that no longer appear (e.g., minor parties), so they do
+# not show up as empty dummy columns in the regression below
+vote_data["candidate"] = vote_data["candidate"].cat.remove_unused_categories()
+vote_data["party_detailed"] = vote_data["party_detailed"].cat.remove_unused_categories()
+
 # Compute vote percent
 vote_data["vote_pct"] = vote_data["candidatevotes"] / vote_data["totalvotes"]
 
@@ -83,69 +97,66 @@ election_years = np.sort(vote_data["year"].unique())
 fred_api_key = "YOUR_FRED_API_KEY_HERE"
 fred = Fred(api_key=fred_api_key)
 
+# Cache FRED downloads on disk so re-running the script does not hit the API
+# again. The cache is keyed on the arguments (series id, start, end); delete the
+# cache/ folder to force a fresh download.
+fred_cache = Memory("cache/fred", verbose=0)
+fred_get_series = fred_cache.cache(fred.get_series)
+
 # Define observation window based on the election years in the vote data
 obs_start = f"{int(election_years.min())}-01-01"
 obs_end   = f"{int(election_years.max())}-06-30"
 
-# --- Unemployment (UNRATE) ---
-# FRED returns a time series with dates; we convert to quarterly and keep Q1/Q2
-unrate = fred.get_series("UNRATE", observation_start=obs_start, observation_end=obs_end)
-unrate = unrate.to_frame(name="unemployment_rate")
-unrate.index = pd.to_datetime(unrate.index)
-unrate = unrate.resample("Q").mean().reset_index().rename(columns={"index": "date"})
-unrate["year"] = unrate["date"].dt.year
-unrate["quarter"] = unrate["date"].dt.quarter
-unemployment_data = unrate[
-    (unrate["year"].isin(election_years)) &
-    (unrate["quarter"] <= 2)
-][["year", "quarter", "unemployment_rate"]].copy()
-
-# --- GDP (GDP) ---
-gdp = fred.get_series("GDP", observation_start=obs_start, observation_end=obs_end)
-gdp = gdp.to_frame(name="gdp")
-gdp.index = pd.to_datetime(gdp.index)
-gdp = gdp.resample("Q").mean().reset_index().rename(columns={"index": "date"})
-gdp["year"] = gdp["date"].dt.year
-gdp["quarter"] = gdp["date"].dt.quarter
-gdp_data = gdp[
-    (gdp["year"].isin(election_years)) &
-    (gdp["quarter"] <= 2)
-][["year", "quarter", "gdp"]].copy()
-
-# --- CPI (CPIAUCSL) ---
-cpi = fred.get_series("CPIAUCSL", observation_start=obs_start, observation_end=obs_end)
-cpi = cpi.to_frame(name="cpi")
-cpi.index = pd.to_datetime(cpi.index)
-cpi = cpi.resample("Q").mean().reset_index().rename(columns={"index": "date"})
-cpi["year"] = cpi["date"].dt.year
-cpi["quarter"] = cpi["date"].dt.quarter
-cpi_data = cpi[
-    (cpi["year"].isin(election_years)) &
-    (cpi["quarter"] <= 2)
-][["year", "quarter", "cpi"]].copy()
+# Series to pull: output column name -> FRED series id
+fred_series = {
+    "unemployment_rate": "UNRATE",    # Unemployment
+    "gdp":               "GDP",       # GDP
+    "cpi":               "CPIAUCSL",  # CPI
+}
+
+# Download each series and line them up by date in one table (one column per
+# series). UNRATE and CPI are monthly and GDP is quarterly, so GDP is missing
+# (NaN) in the other months; mean() below skips those.
+econ_data = pd.concat(
+    {
+        name: fred_get_series(series_id, observation_start=obs_start, observation_end=obs_end)
+        for name, series_id in fred_series.items()
+    },
+    axis=1
+)
+econ_data.index = pd.to_datetime(econ_data.index)
+
+# We only need Q1/Q2 of election years, so we keep those months first and then
+# average within (year, quarter) for all three series at once.
+# (This avoids resample(), which builds every quarter in the whole window.)
+econ_year = econ_data.index.year
+econ_quarter = econ_data.index.quarter
+econ_keep = np.isin(econ_year, election_years) & (econ_quarter <= 2)
+
+# One long table keyed by (year, quarter)
+combined_long = (
+    econ_data[econ_keep]
+    .groupby([econ_year[econ_keep], econ_quarter[econ_keep]])
+    .mean()
+    .rename_axis(["year", "quarter"])
+    .reset_index()
+    .sort_values(["year", "quarter"])
+)
 
 # (Optional, for teaching) inflation rate example (year-over-year using Q1 vs Q3 lag etc.)
 # The original R code computed inflation_rate and then dropped it before widening.
 # We replicate the same idea but do not use it in the final wide dataset.
-inflation_data = cpi_data.sort_values(["year", "quarter"]).copy()
+inflation_data = combined_long[["year", "quarter", "cpi"]].copy()
 inflation_data["inflation_rate"] = (
     (inflation_data["cpi"] / inflation_data["cpi"].shift(2) - 1) * 100
 )
 
-# Combine all economic data into one long table keyed by (year, quarter)
-combined_long = (
-    unemployment_data
-    .merge(gdp_data, on=["year", "quarter"], how="outer")
-    .merge(inflation_data[["year", "quarter", "cpi"]], on=["year", "quarter"], how="outer")
-    .sort_values(["year", "quarter"])
-)
-
 # Pivot wider like R pivot_wider(names_from=quarter, values_from=c(...), names_sep="_Q")
-combined_wide = combined_long.pivot_table(
-    index="year",
-    columns="quarter",
-    values=["unemployment_rate", "gdp", "cpi"],
-    aggfunc="first"
+# Each (year, quarter) appears once, so a plain unstack is enough (no aggregation).
+combined_wide = (
+    combined_long
+    .set_index(["year", "quarter"])[["unemployment_rate", "gdp", "cpi"]]
+    .unstack("quarter")
 )
 
 # Flatten column names to match the R naming style, e.g. unemployment_rate_Q1
@@ -156,18 +167,23 @@ combined_wide = combined_wide.reset_index()
 # -----------------------------------------------------------------------------
 # Part 3: Merge vote data + economic data and build national forecast features
 # -----------------------------------------------------------------------------
-forecast_data = vote_data.merge(combined_wide, on="year", how="left").copy()
-
-# Incumbent indicator (hard-coded, sequential assignments like the R mutate/ifelse chain)
-forecast_data["incumbent"] = 0
-forecast_data.loc[(forecast_data["candidate"] == "FORD, GERALD") & (forecast_data["year"] == 1976), "incumbent"] = 1
-forecast_data.loc[(forecast_data["candidate"] == "CARTER, JIMMY") & (forecast_data["year"] == 1980), "incumbent"] = 1
-forecast_data.loc[(forecast_data["candidate"] == "REAGAN, RONALD") & (forecast_data["year"] == 1984), "incumbent"] = 1
-forecast_data.loc[(forecast_data["candidate"] == "BUSH, GEORGE H.W.") & (forecast_data["year"] == 1992), "incumbent"] = 1
-forecast_data.loc[(forecast_data["candidate"] == "CLINTON, BILL") & (forecast_data["year"] == 1996), "incumbent"] = 1
-forecast_data.loc[(forecast_data["candidate"] == "BUSH, GEORGE W.") & (forecast_data["year"] == 2004), "incumbent"] = 1
-forecast_data.loc[(forecast_data["candidate"] == "OBAMA, BARACK H.") & (forecast_data["year"] == 2012), "incumbent"] = 1
-forecast_data.loc[(forecast_data["candidate"] == "TRUMP, DONALD J.") & (forecast_data["year"] == 2020), "incumbent"] = 1
+forecast_data = vote_data.merge(combined_wide, on="year", how="left")
+
+# Incumbent indicator (hard-coded list of (candidate, year) pairs, like the R
+# mutate/ifelse chain, but matched against all rows in one pass)
+incumbents = [
+    ("FORD, GERALD", 1976),
+    ("CARTER, JIMMY", 1980),
+    ("REAGAN, RONALD", 1984),
+    ("BUSH, GEORGE H.W.", 1992),
+    ("CLINTON, BILL", 1996),
+    ("BUSH, GEORGE W.", 2004),
+    ("OBAMA, BARACK H.", 2012),
+    ("TRUMP, DONALD J.", 2020),
+]
+forecast_data["incumbent"] = (
+    forecast_data.set_index(["candidate", "year"]).index.isin(incumbents).astype(np.int8)
+)
 
 # Quarter-to-quarter changes (Q2 - Q1), matching the R code
 forecast_data["gdp_change"] = forecast_data["gdp_Q2"] - forecast_data["gdp_Q1"]
@@ -175,23 +191,35 @@ forecast_data["cpi_change"] = forecast_data["cpi_Q2"] - forecast_data["cpi_Q1"]
 forecast_data["unemploy_change"] = forecast_data["unemployment_rate_Q2"] - forecast_data["unemployment_rate_Q1"]
 
 # Split training (pre-2020) vs testing (2020)
+# (.copy() only where we add columns afterwards; the test set is read-only)
 forecast_data_training = forecast_data[forecast_data["year"] < 2020].copy()
-forecast_data_testing  = forecast_data[forecast_data["year"] == 2020].copy()
+forecast_data_testing  = forecast_data[forecast_data["year"] == 2020]
 
 # Fit the national OLS model
 # R: vote_pct ~ incumbent * unemploy_change + party_detailed + poly(year, 2, raw = T)
 # Python: use year + year^2 explicitly
-train_ols = smf.ols(
+#
+# We only need coefficients and predictions, so we solve OLS directly:
+#   1) patsy turns the formula into y and a design matrix X (dummies, interactions)
+#   2) QR factorization X = QR, then solve the triangular system R b = Q'y
+y_train, X_train = patsy.dmatrices(
     "vote_pct ~ incumbent * unemploy_change + C(party_detailed) + year + I(year**2)",
-    data=forecast_data_training
-).fit()
+    data=forecast_data_training,
+    return_type="dataframe"
+)
+Q_train, R_train = np.linalg.qr(X_train.values)
+train_beta = solve_triangular(R_train, Q_train.T @ y_train["vote_pct"].values)
 
 # Generate predictions for training data
-forecast_data_training["pred_vote"] = train_ols.predict(forecast_data_training)
+# These are the fitted values X b, so we reuse the training design matrix
+train_fitted = X_train @ train_beta
+forecast_data_training["pred_vote"] = train_fitted
 print(forecast_data_training[["vote_pct", "pred_vote"]].head(20))
 
 # Generate predictions for test data (2020)
-test_pred = train_ols.predict(forecast_data_testing)
+# (build_design_matrices re-applies the same formula coding to new data)
+X_test = patsy.build_design_matrices([X_train.design_info], forecast_data_testing, return_type="dataframe")[0]
+test_pred = X_test @ train_beta
 print("\n2020 test predictions (first few):")
 print(test_pred.head())
 
@@ -204,6 +232,7 @@ print(test_pred.head())
 poll_census_path = "poll_census_data.rds"
 poll_census_obj = pyreadr.read_r(poll_census_path)
 poll_census_data = list(poll_census_obj.values())[0]
+poll_census_data = poll_census_data.astype({"party_simplified": "category", "state_po": "category"})
 
 # Prepare economic data for merging with state-level data (distinct year-level fields)
 forecast_econ = forecast_data[
@@ -219,16 +248,32 @@ state_data = poll_census_data.merge(forecast_econ, on="year", how="left")
 
 # Fit the state-level OLS model (training: year < 2020)
 # R: vote_pct ~ poll_avg + year + party_simplified + white + black + asian + hispanic
-pred_results = smf.ols(
+# Same QR approach as the national model
+state_training = state_data[state_data["year"] < 2020].copy()
+state_testing  = state_data[state_data["year"] >= 2020].copy()
+
+# Drop party levels that never appear before 2020 (as for vote_data above): an
+# unused level would become an all-zero dummy column and make R singular.
+# The test set gets the same levels, so the design matrix columns line up.
+state_training["party_simplified"] = state_training["party_simplified"].cat.remove_unused_categories()
+state_testing["party_simplified"] = state_testing["party_simplified"].cat.set_categories(
+    state_training["party_simplified"].cat.categories
+)
+
+y_state, X_state = patsy.dmatrices(
     "vote_pct ~ poll_avg + year + C(party_simplified) + white + black + asian + hispanic",
-    data=state_data[state_data["year"] < 2020]
-).fit()
+    data=state_training,
+    return_type="dataframe"
+)
+Q_state, R_state = np.linalg.qr(X_state.values)
+state_beta = solve_triangular(R_state, Q_state.T @ y_state["vote_pct"].values)
 
-# Out-of-sample predictions for 2020 and beyond
-out_of_sample = pred_results.predict(state_data[state_data["year"] >= 2020])
+# Out-of-sample predictions for 2020 and beyond (same formula coding as training)
+X_state_new = patsy.build_design_matrices([X_state.design_info], state_testing, return_type="dataframe")[0]
+out_of_sample = X_state_new @ state_beta
 
 # Prepare election outcomes table (actual + predicted)
-elect_outcomes = state_data[state_data["year"] >= 2020][
+elect_outcomes = state_testing[
     ["year", "state_po", "party_simplified", "candidate", "vote_pct"]
 ].copy()
 
@@ -242,16 +287,18 @@ elect_outcomes["vote_pred"] = out_of_sample.values
 elect_2020 = elect_outcomes[elect_outcomes["year"] == 2020].copy()
 
 # Standardize candidate names into a simple label for pivoting
-elect_2020["candidate_simple"] = elect_2020["candidate"].astype(str).str.lower()
-elect_2020.loc[elect_2020["candidate_simple"].str.contains("biden"), "candidate_simple"] = "biden"
-elect_2020.loc[elect_2020["candidate_simple"].str.contains("trump"), "candidate_simple"] = "trump"
+# One regex pass pulls out "biden" or "trump"; other names keep their lowercase form
+candidate_lower = elect_2020["candidate"].astype(str).str.lower()
+elect_2020["candidate_simple"] = (
+    candidate_lower.str.extract(r"(biden|trump)", expand=False).fillna(candidate_lower)
+)
 
 # Pivot wide like R pivot_wider(... names_glue = "{candidate}_{.value}")
-wide_2020 = elect_2020.pivot_table(
-    index=["state_po", "year"],
-    columns="candidate_simple",
-    values=["vote_pct", "vote_pred"],
-    aggfunc="first"
+# Each (state, year, candidate) appears once, so a plain unstack is enough.
+wide_2020 = (
+    elect_2020
+    .set_index(["state_po", "year", "candidate_simple"])[["vote_pct", "vote_pred"]]
+    .unstack("candidate_simple")
 )
 
 # Flatten column names to match the R naming style (candidate_value)
@@ -259,12 +306,12 @@ wide_2020.columns = [f"{cand}_{val}" for val, cand in wide_2020.columns]
 wide_2020 = wide_2020.reset_index()
 
 # Vote difference (Biden minus Trump), matching the R intent
-vote_diff_2020 = wide_2020.copy()
-vote_diff_2020["vote_diff"] = vote_diff_2020["biden_vote_pct"] - vote_diff_2020["trump_vote_pct"]
-vote_diff_2020 = vote_diff_2020[["state_po", "vote_diff"]].drop_duplicates()
+vote_diff_2020 = wide_2020[["state_po"]].assign(
+    vote_diff=wide_2020["biden_vote_pct"] - wide_2020["trump_vote_pct"]
+).drop_duplicates()
 
 # (Optional) Remove AK and HI to mimic the R map example
-vote_diff_2020 = vote_diff_2020[~vote_diff_2020["state_po"].isin(["AK", "HI"])].copy()
+vote_diff_2020 = vote_diff_2020[~vote_diff_2020["state_po"].isin(["AK", "HI"])]
 
 # Plot a simple choropleth map of the vote difference
 fig = px.choropleth(
@@ -21,16 +21,25 @@
 # Setup
 # -----------------------------------------------------------------------------
 # Recommended installs (run once in terminal):
-#   pip install numpy pandas matplotlib statsmodels
+#   pip install numpy pandas matplotlib
+# Optional (NVIDIA GPU only), for very large permutation runs in Part 4:
+#   pip install cupy-cuda12x
 
 import os
 import numpy as np
 import pandas as pd
+import matplotlib
+matplotlib.use("Agg")  # write figures to files only; no GUI window is opened
 import matplotlib.pyplot as plt
-import statsmodels.formula.api as smf
 
-# Reproducibility
-np.random.seed(123)
+# CuPy is optional: it provides NumPy-style arrays that live on a GPU.
+try:
+    import cupy as cp
+except ImportError:
+    cp = None
+
+# Reproducibility: one seeded Generator (PCG64) drives every random draw below
+rng = np.random.default_rng(123)
 
 # Create common project folders (safe to run repeatedly)
 os.makedirs("data_raw", exist_ok=True)
@@ -58,23 +67,23 @@ os.makedirs("src", exist_ok=True)
 n = 5000
 
 # True confounder
-x_true = np.random.normal(loc=0.0, scale=1.0, size=n)
+x_true = rng.normal(loc=0.0, scale=1.0, size=n)
 
 # Treatment assignment correlated with x_true (logistic link)
 # (This creates confounding: D is not independent of x_true.)
 logit_p = 1.0 * x_true
 p = 1.0 / (1.0 + np.exp(-logit_p))
-d = np.random.binomial(n=1, p=p, size=n)
+d = rng.binomial(n=1, p=p, size=n)
 
 # True outcome model
 tau = 1.0     # true effect of D on Y
 beta = 1.0    # effect of X_true on Y
-eps_y = np.random.normal(loc=0.0, scale=1.0, size=n)
+eps_y = rng.normal(loc=0.0, scale=1.0, size=n)
 
 y = tau * d + beta * x_true + eps_y
 
 # Placebo outcome (negative control outcome): NOT affected by D by construction
-eps_pl = np.random.normal(loc=0.0, scale=1.0, size=n)
+eps_pl = rng.normal(loc=0.0, scale=1.0, size=n)
 y_placebo = 0.0 * d + beta * x_true + eps_pl
 
 df_base = pd.DataFrame(
@@ -113,86 +122,99 @@ R = 30  # repetitions (to see variability from measurement error draws)
 
 # Fix a "validation sample" index set (20% of observations)
 validation_share = 0.20
-validation_idx = np.random.choice(np.arange(n), size=int(validation_share * n), replace=False)
+validation_idx = rng.choice(np.arange(n), size=int(validation_share * n), replace=False)
 is_validation = np.zeros(n, dtype=bool)
 is_validation[validation_idx] = True
 
-# Storage
-rows = []
+# Storage: one row per sigma_u, one column per repetition
+G = len(sigma_u_grid)
+tau_naive = np.empty((G, R))
+tau_cal = np.empty((G, R))
+tau_placebo = np.empty((G, R))
+
+beta_naive = np.empty((G, R))
+beta_cal = np.empty((G, R))
+
+# Design matrices for OLS via the normal equations: beta_hat = (X'X)^{-1} X'y.
+# statsmodels formulas are convenient, but each fit re-parses the formula and
+# rebuilds the design matrix. Inside a simulation loop we only need the point
+# estimates, so we solve the small (3 x 3) linear systems directly with NumPy.
+# Column order in every design matrix: [intercept, d, covariate].
+ones = np.ones(n)
+
+# (A) Oracle regression: y ~ d + x_true
+# The oracle model does not involve x_obs, so it is the same in every
+# repetition and for every sigma_u. Fit it once, outside the loops.
+X_oracle = np.column_stack([ones, d, x_true])
+coef_oracle = np.linalg.solve(X_oracle.T @ X_oracle, X_oracle.T @ y)
+tau_oracle = float(coef_oracle[1])
+beta_oracle = float(coef_oracle[2])
+
+# Draw all measurement-error noise up front in one call: standard normals with
+# shape (len(sigma_u_grid), R, n), scaled by sigma_u inside the loop.
+U = rng.standard_normal((G, R, n))
 
 print("\n--- Running measurement error simulations ---")
-for sigma_u in sigma_u_grid:
-    tau_oracle_list = []
-    tau_naive_list = []
-    tau_cal_list = []
-    tau_placebo_list = []
-
-    beta_oracle_list = []
-    beta_naive_list = []
-    beta_cal_list = []
-
+for i, sigma_u in enumerate(sigma_u_grid):
     for r in range(R):
         # Draw measurement error and observed covariate
-        u = np.random.normal(loc=0.0, scale=sigma_u, size=n)
+        u = sigma_u * U[i, r]
         x_obs = x_true + u
 
-        df = df_base.copy()
-        df["x_obs"] = x_obs
-
-        # (A) Oracle regression: y ~ d + x_true
-        fit_oracle = smf.ols("y ~ d + x_true", data=df).fit()
-
-        tau_oracle_list.append(fit_oracle.params["d"])
-        beta_oracle_list.append(fit_oracle.params["x_true"])
-
         # (B) Naive regression with error-prone confounder: y ~ d + x_obs
-        fit_naive = smf.ols("y ~ d + x_obs", data=df).fit()
+        X_naive = np.column_stack([ones, d, x_obs])
+        XtX_naive = X_naive.T @ X_naive
+        coef_naive = np.linalg.solve(XtX_naive, X_naive.T @ y)
 
-        tau_naive_list.append(fit_naive.params["d"])
-        beta_naive_list.append(fit_naive.params["x_obs"])
+        tau_naive[i, r] = coef_naive[1]
+        beta_naive[i, r] = coef_naive[2]
 
         # (C) Regression calibration (validation subsample):
         #     estimate x_true ~ x_obs on validation sample, then predict x_hat for all.
-        df_val = df.loc[is_validation, ["x_true", "x_obs"]].copy()
-        fit_cal = smf.ols("x_true ~ x_obs", data=df_val).fit()
+        X_val = np.column_stack([ones[is_validation], x_obs[is_validation]])
+        coef_cal = np.linalg.solve(X_val.T @ X_val, X_val.T @ x_true[is_validation])
 
-        df["x_hat"] = fit_cal.predict(df[["x_obs"]])
+        x_hat = coef_cal[0] + coef_cal[1] * x_obs
 
-        fit_calibrated = smf.ols("y ~ d + x_hat", data=df).fit()
+        X_calibrated = np.column_stack([ones, d, x_hat])
+        coef_calibrated = np.linalg.solve(X_calibrated.T @ X_calibrated, X_calibrated.T @ y)
 
-        tau_cal_list.append(fit_calibrated.params["d"])
-        beta_cal_list.append(fit_calibrated.params["x_hat"])
+        tau_cal[i, r] = coef_calibrated[1]
+        beta_cal[i, r] = coef_calibrated[2]
 
         # Outcome placebo: y_placebo ~ d + x_obs
         # If the pipeline is "finding effects" here, that suggests bias/artifacts.
-        fit_placebo = smf.ols("y_placebo ~ d + x_obs", data=df).fit()
-        tau_placebo_list.append(fit_placebo.params["d"])
-
-    # Summaries per sigma_u
-    rows.append(
-        {
-            "sigma_u": sigma_u,
-            "tau_true": tau,
-            "tau_oracle_mean": float(np.mean(tau_oracle_list)),
-            "tau_naive_mean": float(np.mean(tau_naive_list)),
-            "tau_cal_mean": float(np.mean(tau_cal_list)),
-            "tau_placebo_mean": float(np.mean(tau_placebo_list)),
-            "tau_oracle_q025": float(np.quantile(tau_oracle_list, 0.025)),
-            "tau_oracle_q975": float(np.quantile(tau_oracle_list, 0.975)),
-            "tau_naive_q025": float(np.quantile(tau_naive_list, 0.025)),
-            "tau_naive_q975": float(np.quantile(tau_naive_list, 0.975)),
-            "tau_cal_q025": float(np.quantile(tau_cal_list, 0.025)),
-            "tau_cal_q975": float(np.quantile(tau_cal_list, 0.975)),
-            "beta_true": beta,
-            "beta_oracle_mean": float(np.mean(beta_oracle_list)),
-            "beta_naive_mean": float(np.mean(beta_naive_list)),
-            "beta_cal_mean": float(np.mean(beta_cal_list)),
-        }
-    )
+        # Same design as the naive model, so X'X is reused.
+        coef_placebo = np.linalg.solve(XtX_naive, X_naive.T @ y_placebo)
+        tau_placebo[i, r] = coef_placebo[1]
 
     print(f"  done sigma_u={sigma_u}")
 
-results = pd.DataFrame(rows)
+# Summaries per sigma_u (row-wise over the R repetitions).
+# Passing both probabilities to one np.quantile call sorts each row once.
+tau_naive_q = np.quantile(tau_naive, [0.025, 0.975], axis=1)
+tau_cal_q = np.quantile(tau_cal, [0.025, 0.975], axis=1)
+
+results = pd.DataFrame(
+    {
+        "sigma_u": sigma_u_grid,
+        "tau_true": tau,
+        "tau_oracle_mean": tau_oracle,
+        "tau_naive_mean": tau_naive.mean(axis=1),
+        "tau_cal_mean": tau_cal.mean(axis=1),
+        "tau_placebo_mean": tau_placebo.mean(axis=1),
+        "tau_oracle_q025": tau_oracle,
+        "tau_oracle_q975": tau_oracle,
+        "tau_naive_q025": tau_naive_q[0],
+        "tau_naive_q975": tau_naive_q[1],
+        "tau_cal_q025": tau_cal_q[0],
+        "tau_cal_q975": tau_cal_q[1],
+        "beta_true": beta,
+        "beta_oracle_mean": beta_oracle,
+        "beta_naive_mean": beta_naive.mean(axis=1),
+        "beta_cal_mean": beta_cal.mean(axis=1),
+    }
+)
 print("\n--- Summary (means) ---")
 print(results[["sigma_u", "tau_true", "tau_oracle_mean", "tau_naive_mean", "tau_cal_mean", "tau_placebo_mean"]])
 
@@ -214,7 +236,6 @@ plt.ylabel("Estimated coefficient on d")
 plt.legend()
 plt.tight_layout()
 plt.savefig("figures/measurement_error_tau_vs_sigma.png", dpi=200)
-plt.close()
 
 # Plot beta estimates vs sigma_u (confounder coefficient attenuation)
 plt.figure(figsize=(8, 5))
@@ -228,7 +249,6 @@ plt.ylabel("Estimated coefficient on confounder term")
 plt.legend()
 plt.tight_layout()
 plt.savefig("figures/measurement_error_beta_vs_sigma.png", dpi=200)
-plt.close()
 
 # -----------------------------------------------------------------------------
 # Part 4: Treatment permutation placebo (randomization inference)
@@ -238,38 +258,80 @@ plt.close()
 # Then we build a null distribution by permuting d.
 
 sigma_u_perm = 1.0
-u_perm = np.random.normal(loc=0.0, scale=sigma_u_perm, size=n)
+u_perm = rng.normal(loc=0.0, scale=sigma_u_perm, size=n)
 x_obs_perm = x_true + u_perm
 
-df_perm_base = df_base.copy()
-df_perm_base["x_obs"] = x_obs_perm
-
-fit_obs = smf.ols("y ~ d + x_obs", data=df_perm_base).fit()
-tau_hat_obs = float(fit_obs.params["d"])
+X_obs = np.column_stack([np.ones(n), d, x_obs_perm])
+coef_obs = np.linalg.solve(X_obs.T @ X_obs, X_obs.T @ y)
+tau_hat_obs = float(coef_obs[1])
 
 print("\n--- Permutation placebo setup ---")
 print("sigma_u used:", sigma_u_perm)
 print("Observed tau_hat (naive model):", round(tau_hat_obs, 4))
 
 B = 500
-tau_perm = []
-
-for b in range(B):
-    d_perm = np.random.permutation(df_perm_base["d"].values)
-    df_b = df_perm_base.copy()
-    df_b["d_perm"] = d_perm
 
-    fit_b = smf.ols("y ~ d_perm + x_obs", data=df_b).fit()
-    tau_perm.append(float(fit_b.params["d_perm"]))
-
-tau_perm = np.array(tau_perm)
+# Frisch-Waugh-Lovell: the coefficient on d_perm in y ~ d_perm + x_obs equals
+# the slope from regressing residualized y on residualized d_perm, where both
+# are residualized on Z = [1, x_obs]. Only d_perm changes across permutations,
+# so we residualize y once and never refit the full model:
+#   tau_b = (d_perm' y_res) / (d_perm' d_perm - (Z'd_perm)' (Z'Z)^{-1} (Z'd_perm))
+# (y_res is already orthogonal to Z, so d_perm' y_res = d_res' y_res.)
+# Shuffling does not change a vector's sum of squares, so d_perm' d_perm = d'd.
+Z = np.column_stack([np.ones(n), x_obs_perm])
+ZtZ_inv = np.linalg.inv(Z.T @ Z)
+y_res = y - Z @ (ZtZ_inv @ (Z.T @ y))
+dtd = float(d @ d)
+
+# Everything a permutation needs comes from one product with W = [y_res, Z].
+W = np.column_stack([y_res, Z])
+
+# Array backend: when B * n is large (e.g., B = 10,000 permutations) and CuPy
+# is installed, the matrix products below run on the GPU. For the
+# default B = 500 the work is small and stays in NumPy on the CPU.
+# CuPy mirrors the NumPy API, so the code is the same; xp is "the array module".
+use_gpu = cp is not None and B * n > 1e7
+xp = cp if use_gpu else np
+to_numpy = cp.asnumpy if use_gpu else np.asarray
+
+W_xp = xp.asarray(W)
+ZtZ_inv_xp = xp.asarray(ZtZ_inv)
+
+# Permutations are processed in blocks: row b of D_buf is a shuffled copy of d.
+# Blocks keep memory bounded (perm_block x n) if B is raised.
+# D_buf is allocated once; rng.permuted(..., out=...) shuffles each row in place
+# (Fisher-Yates), so no new arrays are created per permutation. Re-shuffling an
+# already shuffled row is still a uniformly random permutation of d.
+# The shuffles come from rng, so both backends use the same permutations.
+perm_block = 100
+D_buf = np.tile(d.astype(float), (perm_block, 1))
+tau_perm = np.empty(B)
+
+for start in range(0, B, perm_block):
+    stop = min(start + perm_block, B)
+    D_perm = D_buf[: stop - start]
+    rng.permuted(D_perm, axis=1, out=D_perm)
+    D_perm = xp.asarray(D_perm)
+
+    DW = D_perm @ W_xp                                     # (block, 3)
+    num = DW[:, 0]                                         # d_perm' y_res
+    Zd = DW[:, 1:]                                         # Z'd_perm per row
+    den = dtd - xp.einsum("bi,ij,bj->b", Zd, ZtZ_inv_xp, Zd)
+    tau_perm[start:stop] = to_numpy(num / den)
 
 # Empirical two-sided p-value
 p_emp = (1.0 + np.sum(np.abs(tau_perm) >= np.abs(tau_hat_obs))) / (B + 1.0)
 print("Empirical p-value (two-sided):", round(p_emp, 4))
 
-perm_df = pd.DataFrame({"tau_perm": tau_perm})
-perm_df.to_csv("outputs/permutation_tau_distribution.csv", index=False)
+# Save the null distribution as a compressed binary NumPy file (no text
+# formatting of floats). Read it back with:
+#   perm = np.load("outputs/permutation_tau_distribution.npz"); perm["tau_perm"]
+np.savez_compressed(
+    "outputs/permutation_tau_distribution.npz",
+    tau_perm=tau_perm,
+    tau_obs=tau_hat_obs,
+    sigma_u=sigma_u_perm,
+)
 
 # Plot permutation distribution + observed line
 plt.figure(figsize=(8, 5))
@@ -282,14 +344,16 @@ plt.ylabel("Count")
 plt.legend()
 plt.tight_layout()
 plt.savefig("figures/permutation_placebo_tau_hist.png", dpi=200)
-plt.close()
+
+# Release all figures at once
+plt.close("all")
 
 # -----------------------------------------------------------------------------
 # End of script
 # -----------------------------------------------------------------------------
 print("\nDone. Outputs written to:")
 print("  outputs/measurement_error_results.csv")
-print("  outputs/permutation_tau_distribution.csv")
+print("  outputs/permutation_tau_distribution.npz")
 print("  figures/measurement_error_tau_vs_sigma.png")
 print("  figures/measurement_error_beta_vs_sigma.png")
 print("  figures/permutation_placebo_tau_hist.png")
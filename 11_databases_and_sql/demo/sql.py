@@ -30,7 +30,7 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
-from datetime import date, timedelta
+from datetime import date
 
 # -----------------------------------------------------------------------------
 # Part 1: Create and Populate a Local SQLite Database
@@ -42,6 +42,7 @@ from datetime import date, timedelta
 #   3) Create tables
 #   4) Insert simulated data
 #   5) Add indexes to speed up common queries
+#   6) Build a denormalized "wide" table for analysis queries
 
 # -----------------------------------------------------------------------------
 # Step 1: Connect to a database file
@@ -50,58 +51,90 @@ from datetime import date, timedelta
 con = sqlite3.connect("campaign_finance.db")
 cur = con.cursor()
 
-# -----------------------------------------------------------------------------
-# Step 2: Drop tables (so the script can be rerun from scratch)
-# -----------------------------------------------------------------------------
-# SQL keyword notes:
-# - DROP TABLE removes a table
-# - IF EXISTS prevents errors if the table does not exist
-
-cur.execute("DROP TABLE IF EXISTS contributions;")
-cur.execute("DROP TABLE IF EXISTS contributors;")
-cur.execute("DROP TABLE IF EXISTS candidates;")
-con.commit()
+# Speed settings for a bulk load (PRAGMA = SQLite configuration statements):
+# - journal_mode = WAL: write-ahead log instead of copying pages to a rollback journal
+# - synchronous = OFF: do not wait for the disk to confirm every write
+#   (fine here: if the script crashes we simply rebuild the database)
+# - temp_store = MEMORY: keep temporary tables/sorts (e.g., index builds) in RAM
+# - cache_size = -262144: allow up to ~256 MB of page cache (negative = KiB)
+cur.executescript("""
+  PRAGMA journal_mode = WAL;
+  PRAGMA synchronous = OFF;
+  PRAGMA temp_store = MEMORY;
+  PRAGMA cache_size = -262144;
+""")
 
 # -----------------------------------------------------------------------------
+# Step 2: Drop views and tables (so the script can be rerun from scratch)
 # Step 3: Create tables
 # -----------------------------------------------------------------------------
 # SQL keyword notes:
+# - DROP VIEW removes a saved query (see Part 2)
+# - DROP TABLE removes a table
+# - IF EXISTS prevents errors if the table does not exist
 # - CREATE TABLE creates a new table
-# - PRIMARY KEY uniquely identifies each row
+# - PRIMARY KEY uniquely identifies each row. "id INTEGER PRIMARY KEY" makes
+#   id the table's built-in rowid, so rows are stored in id order and a JOIN
+#   on id finds each row with a single b-tree lookup. (Declaring the table
+#   WITHOUT ROWID does not save a lookup here; it only helps tables whose
+#   primary key is not a single INTEGER column.)
 # - FOREIGN KEY enforces relationships between tables (relational structure)
+# - Dates are stored as whole numbers (days since 2024-01-01) instead of text:
+#   integers are smaller and faster to sort/compare. SQLite's DATE() function
+#   turns them back into readable dates, e.g. DATE('2024-01-01', '+45 days').
+# - GENERATED ALWAYS AS (...) VIRTUAL defines a generated column: its value is
+#   computed from other columns of the same row whenever it is read, and is not
+#   stored. Names like 'Contributor 17' follow directly from the id, so we let
+#   SQLite build them instead of inserting 100,000 name strings.
+#
+# executescript() runs the whole schema script in one call. Wrapping it in
+# BEGIN/COMMIT makes the drops and creates a single transaction, so the schema
+# is rebuilt with one commit instead of one per statement. Indexes are still
+# built after the data is loaded (Step 6), and each view is created next to
+# the query it saves (Part 2).
+
+cur.executescript("""
+  BEGIN;
+
+  DROP VIEW IF EXISTS v_top_occupations;
+  DROP VIEW IF EXISTS v_party_pct_over_1000;
+  DROP VIEW IF EXISTS v_candidates_most_states;
+  DROP VIEW IF EXISTS v_cross_party_donors;
+  DROP VIEW IF EXISTS v_moving_avg_top3;
+  DROP VIEW IF EXISTS v_party_totals;
+  DROP TABLE IF EXISTS contributions_wide;
+  DROP TABLE IF EXISTS contributions;
+  DROP TABLE IF EXISTS contributors;
+  DROP TABLE IF EXISTS candidates;
 
-cur.execute("""
   CREATE TABLE candidates (
     id INTEGER PRIMARY KEY,
-    name TEXT NOT NULL,
+    name TEXT NOT NULL GENERATED ALWAYS AS ('Candidate ' || id) VIRTUAL,
     party TEXT,
     office TEXT,
     winner INTEGER  -- 1 = winner, 0 = not winner (SQLite stores booleans as integers)
   );
-""")
 
-cur.execute("""
   CREATE TABLE contributors (
     id INTEGER PRIMARY KEY,
-    name TEXT,
+    name TEXT GENERATED ALWAYS AS ('Contributor ' || id) VIRTUAL,
     occupation TEXT,
     employer TEXT,
     state TEXT
   );
-""")
 
-cur.execute("""
   CREATE TABLE contributions (
     id INTEGER PRIMARY KEY,
     contributor_id INTEGER,
     candidate_id INTEGER,
     amount REAL,
-    date TEXT,
+    date INTEGER NOT NULL,  -- days since 2024-01-01 (0 = Jan 1, 365 = Dec 31)
     FOREIGN KEY (contributor_id) REFERENCES contributors(id),
     FOREIGN KEY (candidate_id) REFERENCES candidates(id)
   );
+
+  COMMIT;
 """)
-con.commit()
 
 # -----------------------------------------------------------------------------
 # Step 4: Generate simulated data
@@ -115,8 +148,6 @@ np.random.seed(123)
 # ---- Candidates table (100 candidates) ----
 candidate_ids = np.arange(1, 101)
 
-candidate_names = np.array([f"Candidate {i}" for i in candidate_ids])
-
 candidate_parties = np.random.choice(
     ["Democrat", "Republican", "Independent"],
     size=100,
@@ -137,26 +168,19 @@ candidate_winner = np.random.choice(
     p=[0.5, 0.5]
 )
 
-candidates = pd.DataFrame({
-    "id": candidate_ids,
-    "name": candidate_names,
-    "party": candidate_parties,
-    "office": candidate_offices,
-    "winner": candidate_winner
-})
-
 # ---- Contributors table (100,000 contributors) ----
 contributor_ids = np.arange(1, 100001)
 
-contributor_names = np.array([f"Contributor {i}" for i in contributor_ids])
-
 contributor_occupations = np.random.choice(
     ["Engineer", "Teacher", "Doctor", "Lawyer", "Business Owner"],
     size=100000,
     replace=True
 )
 
-contributor_employers = np.array([f"Company {i}" for i in np.random.randint(1, 5001, size=100000)])
+# 5,000 possible employer names, built once; each contributor gets one at random
+employer_pool = np.array([f"Company {i}" for i in range(1, 5001)])
+employer_idx = np.random.randint(0, 5000, size=100000)
+contributor_employers = employer_pool[employer_idx]
 
 state_abb = [
     "AL","AK","AZ","AR","CA","CO","CT","DE","FL","GA",
@@ -168,69 +192,148 @@ state_abb = [
 
 contributor_states = np.random.choice(state_abb, size=100000, replace=True)
 
-contributors = pd.DataFrame({
-    "id": contributor_ids,
-    "name": contributor_names,
-    "occupation": contributor_occupations,
-    "employer": contributor_employers,
-    "state": contributor_states
-})
-
 # ---- Contributions table (1,000,000 contributions) ----
 # - amount is log-normal to mimic a skewed donation distribution
-# - date is sampled uniformly across 2024
+# - date is sampled uniformly across 2024 (stored as a day offset, see Step 3)
+# - ids and day offsets fit in 32-bit integers (dtype=np.int32), which halves
+#   the memory of these million-element arrays; the random draws are the same
+# - np.round(..., out=contribution_amounts) rounds in place, so no second
+#   million-element array is allocated for the rounded amounts
 contribution_ids = np.arange(1, 1000001)
 
-contribution_contributor_ids = np.random.randint(1, 100001, size=1000000)
-contribution_candidate_ids = np.random.randint(1, 101, size=1000000)
+contribution_contributor_ids = np.random.randint(1, 100001, size=1000000, dtype=np.int32)
+contribution_candidate_ids = np.random.randint(1, 101, size=1000000, dtype=np.int32)
 
-contribution_amounts = np.round(
-    np.random.lognormal(mean=np.log(1000), sigma=1, size=1000000),
-    2
-)
+contribution_amounts = np.random.lognormal(mean=np.log(1000), sigma=1, size=1000000)
+np.round(contribution_amounts, 2, out=contribution_amounts)
 
 start_date = date(2024, 1, 1)
 end_date = date(2024, 12, 31)
 n_days = (end_date - start_date).days + 1
 
-random_day_offsets = np.random.randint(0, n_days, size=1000000)
-contribution_dates = np.array([(start_date + timedelta(days=int(d))).isoformat() for d in random_day_offsets])
-
-contributions = pd.DataFrame({
-    "id": contribution_ids,
-    "contributor_id": contribution_contributor_ids,
-    "candidate_id": contribution_candidate_ids,
-    "amount": contribution_amounts,
-    "date": contribution_dates
-})
+random_day_offsets = np.random.randint(0, n_days, size=1000000, dtype=np.int32)
 
 # -----------------------------------------------------------------------------
 # Step 5: Insert data into the database
 # -----------------------------------------------------------------------------
-# pandas.DataFrame.to_sql() writes a DataFrame into a database table.
-# chunksize helps avoid huge single inserts.
-
-candidates.to_sql("candidates", con, if_exists="append", index=False, chunksize=5000)
-contributors.to_sql("contributors", con, if_exists="append", index=False, chunksize=5000)
-contributions.to_sql("contributions", con, if_exists="append", index=False, chunksize=5000)
-con.commit()
+# We insert rows with the sqlite3 module directly:
+# - An INSERT statement with ? placeholders is prepared once, and executemany()
+#   binds each row's values to it (no pandas/to_sql machinery in between).
+# - zip() pairs up the column arrays into one tuple per row. .tolist() turns
+#   NumPy values into plain Python ints/floats/strings, which sqlite3 accepts.
+#   (No pandas DataFrame is needed just to insert the data.)
+# - "with con:" runs all three inserts in one transaction and commits at the end.
+
+with con:
+    cur.executemany(
+        "INSERT INTO candidates (id, party, office, winner) VALUES (?, ?, ?, ?);",
+        zip(
+            candidate_ids.tolist(),
+            candidate_parties.tolist(),
+            candidate_offices.tolist(),
+            candidate_winner.tolist()
+        )
+    )
+    cur.executemany(
+        "INSERT INTO contributors (id, occupation, employer, state) VALUES (?, ?, ?, ?);",
+        zip(
+            contributor_ids.tolist(),
+            contributor_occupations.tolist(),
+            contributor_employers.tolist(),
+            contributor_states.tolist()
+        )
+    )
+    # For the 1,000,000-row table we convert 10,000 rows at a time. The generator
+    # expression (...) produces rows only as executemany() asks for them, so we
+    # never hold a million Python tuples in memory at once.
+    cur.executemany(
+        "INSERT INTO contributions (id, contributor_id, candidate_id, amount, date) VALUES (?, ?, ?, ?, ?);",
+        (
+            row
+            for start in range(0, 1000000, 10000)
+            for row in zip(
+                contribution_ids[start:start + 10000].tolist(),
+                contribution_contributor_ids[start:start + 10000].tolist(),
+                contribution_candidate_ids[start:start + 10000].tolist(),
+                contribution_amounts[start:start + 10000].tolist(),
+                random_day_offsets[start:start + 10000].tolist()
+            )
+        )
+    )
 
 # -----------------------------------------------------------------------------
 # Step 6: Create indexes (performance optimization)
 # -----------------------------------------------------------------------------
 # Indexes speed up queries that filter/join on these columns.
+# We build them after the data is loaded (building once over the full table is
+# faster than updating the index on every insert).
 # SQL keyword notes:
 # - CREATE INDEX builds an index structure for faster lookups
 # - IF NOT EXISTS prevents errors if an index already exists
+# - (candidate_id, date, id, amount) is a composite "covering" index: entries
+#   are sorted by candidate, then date (then id, so ties keep insertion order),
+#   matching the PARTITION BY / ORDER BY of Query 5's window. Because it also
+#   stores amount, queries that only need these columns (Queries 5 and 6) are
+#   answered from the index alone, without visiting the table. It also serves
+#   every lookup by candidate_id, so no separate candidate_id index is needed.
+# - BEGIN ... COMMIT runs all statements as one transaction
+#   (executescript() runs a multi-statement SQL string)
+
+cur.executescript("""
+  BEGIN;
+  CREATE INDEX IF NOT EXISTS idx_contrib_contributor_id ON contributions (contributor_id);
+  CREATE INDEX IF NOT EXISTS idx_contrib_cand_date_amt  ON contributions (candidate_id, date, id, amount);
+  CREATE INDEX IF NOT EXISTS idx_contrib_amount         ON contributions (amount);
+  CREATE INDEX IF NOT EXISTS idx_contrib_date           ON contributions (date);
+  COMMIT;
+""")
 
-cur.execute("CREATE INDEX IF NOT EXISTS idx_contrib_contributor_id ON contributions (contributor_id);")
-cur.execute("CREATE INDEX IF NOT EXISTS idx_contrib_candidate_id   ON contributions (candidate_id);")
-cur.execute("CREATE INDEX IF NOT EXISTS idx_contrib_amount         ON contributions (amount);")
-cur.execute("CREATE INDEX IF NOT EXISTS idx_contrib_date           ON contributions (date);")
-con.commit()
+# -----------------------------------------------------------------------------
+# Step 7: Build a denormalized analysis table
+# -----------------------------------------------------------------------------
+# Most analysis queries below need a contribution's amount together with a few
+# attributes of its candidate (party, office) or contributor (occupation, state).
+# Instead of re-joining 1,000,000 contributions to the other tables in every
+# query, we do the joins once and store the result as contributions_wide.
+# This is called denormalization: the normalized tables stay the "source of
+# truth", and the wide table is a read-only copy shaped for analysis.
+# SQL keyword notes:
+# - CREATE TABLE ... AS SELECT creates a table from a query result
+# - ORDER BY co.id stores rows in the same order as the contributions table
+# - CREATE INDEX ... WHERE builds a partial index: it only includes rows that
+#   match the condition (here, the large donations used in Query 2)
+# - ANALYZE collects table/index statistics that the query planner uses to
+#   choose join orders and indexes (run once, after all tables and indexes exist)
+
+cur.executescript("""
+  BEGIN;
+  CREATE TABLE contributions_wide AS
+    SELECT
+      co.id,
+      co.contributor_id,
+      co.candidate_id,
+      co.amount,
+      co.date,
+      ca.party,
+      ca.office,
+      c.occupation,
+      c.state
+    FROM contributions co
+    JOIN candidates ca
+      ON co.candidate_id = ca.id
+    JOIN contributors c
+      ON co.contributor_id = c.id
+    ORDER BY co.id;
+  CREATE INDEX idx_wide_contributor_id ON contributions_wide (contributor_id);
+  CREATE INDEX idx_wide_party          ON contributions_wide (party);
+  CREATE INDEX idx_wide_occupation     ON contributions_wide (occupation);
+  CREATE INDEX idx_wide_party_amount_gt1k ON contributions_wide (party, amount) WHERE amount > 1000;
+  ANALYZE;
+  COMMIT;
+""")
 
 # -----------------------------------------------------------------------------
-# Step 7: Quick sanity checks (counts + small samples)
+# Step 8: Quick sanity checks (counts + small samples)
 # -----------------------------------------------------------------------------
 print("\n------------------------------")
 print("Sanity checks: table sizes")
@@ -252,10 +355,11 @@ print(pd.read_sql_query("""
     co.candidate_id,
     ca.name AS candidate_name,
     co.amount,
-    co.date
+    DATE('2024-01-01', '+' || co.date || ' days') AS date
   FROM contributions co
   JOIN candidates ca
     ON co.candidate_id = ca.id
+  ORDER BY co.id
   LIMIT 5;
 """, con))
 
@@ -264,8 +368,28 @@ print(pd.read_sql_query("""
 # -----------------------------------------------------------------------------
 # In each example below, we:
 #   (1) Write a SQL query as a string
-#   (2) Run it with pandas.read_sql_query(query, con)
-#   (3) Print or plot the result
+#   (2) Save it in the database as a VIEW (a named, stored query)
+#   (3) Run "SELECT * FROM <view>" on our cursor and build a DataFrame from
+#       the fetched rows (cur.description holds the column names)
+#   (4) Print or plot the result
+#
+# Views live inside campaign_finance.db, so you (or R, or a database browser)
+# can reuse them later, e.g. SELECT * FROM v_party_totals WHERE party = 'Democrat'.
+#
+# When you re-run a query with different values (in a notebook, say), pass the
+# values as ? bind parameters instead of pasting them into the SQL string:
+#   cur.execute("SELECT * FROM v_party_totals WHERE party = ?;", ("Democrat",))
+#   pd.read_sql_query("SELECT * FROM contributions_wide WHERE amount > ?;", con, params=(5000,))
+# The SQL text then stays the same on every run, so sqlite3 reuses the
+# already-compiled statement from its cache instead of parsing and planning it
+# again (and values are never spliced into SQL by hand).
+# A VIEW itself cannot contain ? parameters, so the queries below keep their
+# values written out. Query 2's "amount > 1000" must be a literal anyway: the
+# planner only uses the partial index from Step 7 when it can see that the
+# query's WHERE matches the index's WHERE.
+#
+# Queries 1-4 and 6 read from contributions_wide (Step 7), so most of them
+# need no JOIN at all. Query 5 uses the normalized tables directly.
 #
 # SQL syntax checklist you’ll see repeatedly:
 # - SELECT: which columns to return
@@ -284,20 +408,21 @@ print(pd.read_sql_query("""
 # - COUNT(*) counts rows per group
 # - GROUP BY creates groups
 # - ORDER BY sorts totals descending
+# - occupation is already stored in contributions_wide, so no JOIN is needed
 
 query_1 = """
   SELECT
-    c.occupation,
-    SUM(co.amount) AS total_amount,
+    occupation,
+    SUM(amount) AS total_amount,
     COUNT(*) AS num_contributions
-  FROM contributors c
-  JOIN contributions co
-    ON c.id = co.contributor_id
-  GROUP BY c.occupation
+  FROM contributions_wide
+  GROUP BY occupation
   ORDER BY total_amount DESC
   LIMIT 10;
 """
-top_occupations = pd.read_sql_query(query_1, con)
+cur.execute("CREATE VIEW v_top_occupations AS " + query_1)
+cur.execute("SELECT * FROM v_top_occupations;")
+top_occupations = pd.DataFrame(cur.fetchall(), columns=[col[0] for col in cur.description])
 
 print("\n------------------------------")
 print("Top 10 occupations by total contribution amount")
@@ -308,26 +433,25 @@ print(top_occupations)
 # Query 2: Percentage of contributions by party for donations > $1000
 # -----------------------------------------------------------------------------
 # Concepts:
-# - WHERE filters to only contributions > 1000
-# - subquery (SELECT SUM(...)) computes the total for the denominator
+# - WHERE filters to only contributions > 1000 (answered from the partial
+#   index built in Step 7, so only the large donations are read)
 # - grouping by party creates one row per party
+# - SUM(SUM(amount)) OVER () is a window function over the grouped rows: it
+#   adds up the per-party totals to get the overall total (the denominator),
+#   so the filtered rows are read only once
 
 query_2 = """
   SELECT
-    ca.party,
-    SUM(co.amount) AS total_amount,
-    SUM(co.amount) * 100.0 / (
-      SELECT SUM(amount)
-      FROM contributions
-      WHERE amount > 1000
-    ) AS percentage
-  FROM contributions co
-  JOIN candidates ca
-    ON co.candidate_id = ca.id
-  WHERE co.amount > 1000
-  GROUP BY ca.party;
+    party,
+    SUM(amount) AS total_amount,
+    SUM(amount) * 100.0 / SUM(SUM(amount)) OVER () AS percentage
+  FROM contributions_wide
+  WHERE amount > 1000
+  GROUP BY party;
 """
-party_pct = pd.read_sql_query(query_2, con)
+cur.execute("CREATE VIEW v_party_pct_over_1000 AS " + query_2)
+cur.execute("SELECT * FROM v_party_pct_over_1000;")
+party_pct = pd.DataFrame(cur.fetchall(), columns=[col[0] for col in cur.description])
 
 print("\n------------------------------")
 print("Percent of total contributions by party (amount > $1000)")
@@ -339,26 +463,27 @@ print(party_pct)
 # -----------------------------------------------------------------------------
 # Concepts:
 # - COUNT(DISTINCT state) counts unique states
-# - join chain: candidates -> contributions -> contributors
+# - contributor state is stored in contributions_wide; we JOIN the small
+#   candidates table only to get each candidate's name
 # - ORDER BY sorts by (num_states, then contribution_count)
 
 query_3 = """
   SELECT
-    ca.id AS candidate_id,
+    w.candidate_id,
     ca.name,
-    ca.party,
-    COUNT(DISTINCT c.state) AS num_states,
-    COUNT(co.id) AS contribution_count
-  FROM candidates ca
-  JOIN contributions co
-    ON ca.id = co.candidate_id
-  JOIN contributors c
-    ON co.contributor_id = c.id
-  GROUP BY ca.id, ca.name, ca.party
+    w.party,
+    COUNT(DISTINCT w.state) AS num_states,
+    COUNT(w.id) AS contribution_count
+  FROM contributions_wide w
+  JOIN candidates ca
+    ON w.candidate_id = ca.id
+  GROUP BY w.candidate_id, ca.name, w.party
   ORDER BY num_states DESC, contribution_count DESC
   LIMIT 5;
 """
-candidates_most_states = pd.read_sql_query(query_3, con)
+cur.execute("CREATE VIEW v_candidates_most_states AS " + query_3)
+cur.execute("SELECT * FROM v_candidates_most_states;")
+candidates_most_states = pd.DataFrame(cur.fetchall(), columns=[col[0] for col in cur.description])
 
 print("\n------------------------------")
 print("Candidates with contributions from the most distinct states")
@@ -372,23 +497,37 @@ print(candidates_most_states)
 # - HAVING filters groups after aggregation
 # - GROUP_CONCAT summarizes unique parties into one string (SQLite feature)
 # - CASE WHEN creates party-specific sums
+# - This query:
+#   (1) finds the first 20 contributors (by id) who gave to more than one party
+#       (the xparty CTE reads only contributor_id and party)
+#   (2) sums amounts by party for just those 20 contributors, and JOINs
+#       contributors for their names
 
 query_4 = """
+  WITH xparty AS (
+    SELECT contributor_id
+    FROM contributions_wide
+    GROUP BY contributor_id
+    HAVING COUNT(DISTINCT party) > 1
+    ORDER BY contributor_id
+    LIMIT 20
+  )
   SELECT
     c.name,
-    GROUP_CONCAT(DISTINCT ca.party) AS parties,
-    SUM(CASE WHEN ca.party = 'Democrat' THEN co.amount ELSE 0 END) AS dem_amount,
-    SUM(CASE WHEN ca.party = 'Republican' THEN co.amount ELSE 0 END) AS rep_amount
-  FROM contributors c
-  JOIN contributions co
-    ON c.id = co.contributor_id
-  JOIN candidates ca
-    ON co.candidate_id = ca.id
-  GROUP BY c.id
-  HAVING COUNT(DISTINCT ca.party) > 1
-  LIMIT 20;
+    GROUP_CONCAT(DISTINCT w.party) AS parties,
+    SUM(CASE WHEN w.party = 'Democrat' THEN w.amount ELSE 0 END) AS dem_amount,
+    SUM(CASE WHEN w.party = 'Republican' THEN w.amount ELSE 0 END) AS rep_amount
+  FROM xparty x
+  JOIN contributions_wide w
+    ON w.contributor_id = x.contributor_id
+  JOIN contributors c
+    ON c.id = x.contributor_id
+  GROUP BY x.contributor_id
+  ORDER BY x.contributor_id;
 """
-cross_party = pd.read_sql_query(query_4, con)
+cur.execute("CREATE VIEW v_cross_party_donors AS " + query_4)
+cur.execute("SELECT * FROM v_cross_party_donors;")
+cross_party = pd.DataFrame(cur.fetchall(), columns=[col[0] for col in cur.description])
 
 print("\n------------------------------")
 print("Cross-party contributors (sample)")
@@ -403,56 +542,42 @@ print(cross_party)
 # - window functions use OVER (PARTITION BY ... ORDER BY ...)
 # - ROWS BETWEEN 29 PRECEDING AND CURRENT ROW defines a rolling window
 # - This query:
-#   (1) builds cumulative totals per candidate
-#   (2) computes 30-day moving average of contribution amounts by candidate
-#   (3) keeps only the top 3 candidates by cumulative amount
+#   (1) finds the top 3 candidates by total amount (a small GROUP BY that
+#       reads only candidate_id and amount from the covering index)
+#   (2) computes a moving average over each candidate's last 30 contributions,
+#       only for those 3 candidates (the window function never sees the
+#       other 97 candidates' rows)
+# - DATE('2024-01-01', '+' || co.date || ' days') converts the stored day offset
+#   back into a calendar date for display (|| joins strings in SQL)
 
 query_5 = """
-  WITH ranked_contributions AS (
-    SELECT
-      ca.id,
-      ca.name,
-      co.date,
-      co.amount,
-      SUM(co.amount) OVER (
-        PARTITION BY ca.id
-        ORDER BY co.date
-      ) AS cumulative_amount
-    FROM candidates ca
-    JOIN contributions co
-      ON ca.id = co.candidate_id
-  ),
-  windowed_avg AS (
-    SELECT
-      id,
-      name,
-      date,
-      amount,
-      AVG(amount) OVER (
-        PARTITION BY id
-        ORDER BY date
-        ROWS BETWEEN 29 PRECEDING AND CURRENT ROW
-      ) AS moving_avg
-    FROM ranked_contributions
-  )
-  SELECT
-    id,
-    name,
-    date,
-    amount,
-    moving_avg
-  FROM windowed_avg
-  WHERE id IN (
-    SELECT id
-    FROM ranked_contributions
-    GROUP BY id
-    ORDER BY MAX(cumulative_amount) DESC
+  WITH top_candidates AS (
+    SELECT candidate_id
+    FROM contributions
+    GROUP BY candidate_id
+    ORDER BY SUM(amount) DESC
     LIMIT 3
   )
-  ORDER BY id, date
+  SELECT
+    ca.id,
+    ca.name,
+    DATE('2024-01-01', '+' || co.date || ' days') AS date,
+    co.amount,
+    AVG(co.amount) OVER (
+      PARTITION BY ca.id
+      ORDER BY co.date
+      ROWS BETWEEN 29 PRECEDING AND CURRENT ROW
+    ) AS moving_avg
+  FROM candidates ca
+  JOIN contributions co
+    ON ca.id = co.candidate_id
+  WHERE ca.id IN (SELECT candidate_id FROM top_candidates)
+  ORDER BY ca.id, co.date
   LIMIT 100;
 """
-moving_avg = pd.read_sql_query(query_5, con)
+cur.execute("CREATE VIEW v_moving_avg_top3 AS " + query_5)
+cur.execute("SELECT * FROM v_moving_avg_top3;")
+moving_avg = pd.DataFrame(cur.fetchall(), columns=[col[0] for col in cur.description])
 
 print("\n------------------------------")
 print("Moving average contributions (top 3 candidates, sample rows)")
@@ -468,14 +593,14 @@ print(moving_avg)
 
 query_6 = """
   SELECT
-    ca.party,
-    SUM(co.amount) AS total_amount
-  FROM contributions co
-  JOIN candidates ca
-    ON co.candidate_id = ca.id
-  GROUP BY ca.party;
+    party,
+    SUM(amount) AS total_amount
+  FROM contributions_wide
+  GROUP BY party;
 """
-party_totals = pd.read_sql_query(query_6, con)
+cur.execute("CREATE VIEW v_party_totals AS " + query_6)
+cur.execute("SELECT * FROM v_party_totals;")
+party_totals = pd.DataFrame(cur.fetchall(), columns=[col[0] for col in cur.description])
 
 print("\n------------------------------")
 print("Total contributions by party")
@@ -18,7 +18,7 @@
 # Setup
 # -----------------------------------------------------------------------------
 # If you do not have these installed, run (in Terminal / Anaconda Prompt):
-#   pip install numpy pandas matplotlib networkx scipy scikit-learn torch
+#   pip install numpy pandas matplotlib networkx igraph scipy scikit-learn torch
 #
 # Notes:
 # - We implement a simple 2-layer GCN "by hand" using PyTorch + sparse adjacency.
@@ -28,6 +28,7 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import networkx as nx
+import igraph as ig
 import scipy.sparse as sp
 
 from sklearn.linear_model import LogisticRegression
@@ -37,10 +38,13 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
+import random
 from datetime import date
 
 # Reproducibility
 np.random.seed(123)
+random.seed(123)   # igraph draws its random numbers from Python's random module
+rng = np.random.default_rng(123)   # NumPy's newer (faster) generator, used for the graph and node features
 torch.manual_seed(123)
 
 # -----------------------------------------------------------------------------
@@ -86,13 +90,34 @@ P = np.array([
 ])
 
 # -----------------------------------------------------------------------------
-# Step 2: Generate the graph with NetworkX
-# -----------------------------------------------------------------------------
-# networkx.stochastic_block_model returns an undirected graph by default
-G = nx.stochastic_block_model(block_sizes, P, seed=123)
+# Step 2: Generate the graph's edges with NumPy
+# -----------------------------------------------------------------------------
+# An SBM links each pair of nodes independently, with probability P[i, j] for a
+# node in block i and a node in block j. networkx.stochastic_block_model does
+# this in a Python loop over node pairs; here we do it one block pair at a time:
+# - draw one uniform number per node pair and keep the pairs below P[i, j]
+# - within a block, keep only pairs (a, b) with a < b (each undirected edge
+#   once, and no self-loops)
+# - np.nonzero returns the linked pairs; adding each block's first node number
+#   turns positions inside the block into node numbers 0..(n-1)
+block_starts = np.cumsum([0] + block_sizes[:-1])
+
+edge_u = []
+edge_v = []
+for i in range(num_blocks):
+    for j in range(i, num_blocks):
+        linked = rng.random((block_sizes[i], block_sizes[j])) < P[i, j]
+        if i == j:
+            linked = np.triu(linked, k=1)
+        rows, cols = np.nonzero(linked)
+        edge_u.append(rows + block_starts[i])
+        edge_v.append(cols + block_starts[j])
+
+edge_u = np.concatenate(edge_u)
+edge_v = np.concatenate(edge_v)
 
 # Basic graph summary
-num_edges = G.number_of_edges()
+num_edges = len(edge_u)
 print("Synthetic graph summary:")
 print("  Nodes:", num_nodes)
 print("  Edges:", num_edges)
@@ -102,11 +127,8 @@ print("  Edges:", num_edges)
 # -----------------------------------------------------------------------------
 # For SBM, the first block_sizes[0] nodes are community 0, next are community 1, etc.
 # We keep labels in node order 0..(n-1).
-true_labels = np.concatenate([
-    np.zeros(block_sizes[0], dtype=int),
-    np.ones(block_sizes[1], dtype=int),
-    2 * np.ones(block_sizes[2], dtype=int)
-])
+# np.repeat writes community k block_sizes[k] times, for every block in one call.
+true_labels = np.repeat(np.arange(num_blocks), block_sizes)
 
 # -----------------------------------------------------------------------------
 # Step 4: Create synthetic node features correlated with communities
@@ -129,26 +151,29 @@ centers = np.array([
 
 noise_sd = 0.8
 
-X = np.zeros((num_nodes, num_features), dtype=float)
-X[true_labels == 0] = centers[0] + np.random.normal(0, noise_sd, size=(np.sum(true_labels == 0), num_features))
-X[true_labels == 1] = centers[1] + np.random.normal(0, noise_sd, size=(np.sum(true_labels == 1), num_features))
-X[true_labels == 2] = centers[2] + np.random.normal(0, noise_sd, size=(np.sum(true_labels == 2), num_features))
+# One standard-normal draw makes the noise for every node at once (in float32,
+# the precision PyTorch uses below, which halves the memory); *= scales it to
+# noise_sd in place. centers[true_labels] looks up each node's community
+# center (one row per node), and += adds it in place as well.
+X = rng.standard_normal((num_nodes, num_features), dtype=np.float32)
+X *= noise_sd
+X += centers[true_labels]
 
 # -----------------------------------------------------------------------------
 # Part 2: Graph Construction Workflows (Edge list + adjacency)
 # -----------------------------------------------------------------------------
 # Goal:
-# - Show a common workflow: graph -> edge list -> graph -> adjacency (sparse)
+# - Show a common workflow: edge list -> graph -> adjacency (sparse)
 
 # -----------------------------------------------------------------------------
 # Step 1: Create an edge list
 # -----------------------------------------------------------------------------
-edge_list = pd.DataFrame(list(G.edges()), columns=["u", "v"])
+edge_list = pd.DataFrame({"u": edge_u, "v": edge_v})
 print("\nEdge list (first 10 rows):")
 print(edge_list.head(10))
 
 # -----------------------------------------------------------------------------
-# Step 2: Construct a graph from the edge list (same graph, reconstructed)
+# Step 2: Construct a graph from the edge list
 # -----------------------------------------------------------------------------
 G2 = nx.from_pandas_edgelist(edge_list, source="u", target="v", create_using=nx.Graph())
 
@@ -163,11 +188,30 @@ print("  Edges:", G2.number_of_edges())
 # - Sparse matrices are essential for large graphs.
 # - Dense adjacency is O(n^2) memory, which becomes impossible quickly.
 
-A = nx.to_scipy_sparse_array(G2, format="csr", dtype=np.float32)
+# The nodes are already numbered 0..(n-1), so we build the matrix straight from
+# the edge list: each undirected edge (u, v) fills both (u, v) and (v, u).
+# Row/column i is node i, the same order as true_labels and X.
+u = edge_list["u"].to_numpy()
+v = edge_list["v"].to_numpy()
+
+A = sp.coo_array(
+    (np.ones(2 * len(u), dtype=np.float32), (np.concatenate([u, v]), np.concatenate([v, u]))),
+    shape=(num_nodes, num_nodes)
+).tocsr()
 print("\nAdjacency matrix:")
 print("  Shape:", A.shape)
 print("  Nonzeros:", A.nnz)
 
+# -----------------------------------------------------------------------------
+# Step 4: The same graph in igraph (for heavier algorithms)
+# -----------------------------------------------------------------------------
+# Scalability note:
+# - NetworkX is written in pure Python: easy to read, slow on big graphs.
+# - igraph runs its algorithms in compiled C code, often 10-100x faster.
+# - Vertex ids are the node numbers 0..(n-1), so results line up with true_labels.
+
+G_ig = ig.Graph(n=num_nodes, edges=edge_list[["u", "v"]].to_numpy())
+
 # -----------------------------------------------------------------------------
 # Part 3: Centrality (Examples + Interpretations)
 # -----------------------------------------------------------------------------
@@ -180,7 +224,9 @@ print("  Nonzeros:", A.nnz)
 # -----------------------------------------------------------------------------
 # Step 1: Degree centrality (fast)
 # -----------------------------------------------------------------------------
-deg = np.array([d for _, d in G2.degree()])
+# In CSR, row i's nonzeros sit between indptr[i] and indptr[i+1], so the
+# differences of indptr are the node degrees (in node order 0..n-1).
+deg = np.diff(A.indptr)
 deg_summary = pd.Series(deg).describe()
 print("\nDegree summary:")
 print(deg_summary)
@@ -194,27 +240,28 @@ plt.tight_layout()
 plt.show()
 
 # -----------------------------------------------------------------------------
-# Step 2: Betweenness centrality (approximate; scalability teaching point)
+# Step 2: Betweenness centrality (igraph; scalability teaching point)
 # -----------------------------------------------------------------------------
 # Exact betweenness is expensive for large graphs.
-# NetworkX allows approximation by sampling k nodes.
-# (This keeps the example practical in class.)
-betw = nx.betweenness_centrality(G2, k=200, seed=123)
-betw_values = np.array(list(betw.values()))
+# In pure Python (NetworkX) we would have to approximate it by sampling nodes;
+# igraph's C implementation computes the exact value faster than that.
+# We divide by the number of node pairs, (n-1)(n-2)/2, so values are between
+# 0 and 1 (the "normalized" betweenness NetworkX reports).
+betw_values = np.array(G_ig.betweenness()) / ((num_nodes - 1) * (num_nodes - 2) / 2)
 
 plt.figure()
 plt.hist(betw_values, bins=40)
-plt.title("Approximate betweenness centrality distribution")
-plt.xlabel("Betweenness (approx)")
+plt.title("Betweenness centrality distribution")
+plt.xlabel("Betweenness (normalized)")
 plt.ylabel("Count of nodes")
 plt.tight_layout()
 plt.show()
 
 # -----------------------------------------------------------------------------
-# Step 3: Eigenvector centrality (numpy-based; OK for medium graphs)
+# Step 3: Eigenvector centrality (igraph)
 # -----------------------------------------------------------------------------
-eig = nx.eigenvector_centrality_numpy(G2)
-eig_values = np.array(list(eig.values()))
+# igraph scales the scores so the most central node has 1.0
+eig_values = np.array(G_ig.eigenvector_centrality())
 
 plt.figure()
 plt.hist(eig_values, bins=40)
@@ -234,22 +281,15 @@ plt.show()
 # -----------------------------------------------------------------------------
 # Step 1: Louvain community detection
 # -----------------------------------------------------------------------------
-# networkx.algorithms.community.louvain_communities returns a list of sets of nodes
-louvain_comms = nx.algorithms.community.louvain_communities(G2, seed=123)
-
-# Convert communities into a node -> community_id vector
-louvain_labels = np.zeros(num_nodes, dtype=int)
+# igraph's community_multilevel is the Louvain method, run in C.
+# Its membership is already a node -> community_id vector (one entry per node).
+louvain_comms = G_ig.community_multilevel()
+louvain_labels = np.array(louvain_comms.membership)
 
-comm_id = 0
-for comm in louvain_comms:
-    for node in comm:
-        louvain_labels[node] = comm_id
-    comm_id = comm_id + 1
+louvain_sizes = louvain_comms.sizes()
 
 print("\nCommunity detection summary:")
 print("  Number of Louvain communities:", len(louvain_comms))
-
-louvain_sizes = [len(c) for c in louvain_comms]
 print("  Louvain community sizes (first 10):", louvain_sizes[:10])
 
 # -----------------------------------------------------------------------------
@@ -318,13 +358,19 @@ print("  Test accuracy:", test_acc_lr)
 # Step 1: Add self-loops and compute normalized adjacency (sparse)
 # -----------------------------------------------------------------------------
 I = sp.eye(num_nodes, format="csr", dtype=np.float32)
-A_tilde = A + I
+A_tilde = (A + I).tocsr()
 
 deg_tilde = np.array(A_tilde.sum(axis=1)).flatten()
-deg_inv_sqrt = 1.0 / np.sqrt(deg_tilde)
+deg_inv_sqrt = (1.0 / np.sqrt(deg_tilde)).astype(np.float32)
 
-D_inv_sqrt = sp.diags(deg_inv_sqrt.astype(np.float32), format="csr")
-A_norm = D_inv_sqrt @ A_tilde @ D_inv_sqrt
+# D^{-1/2} A_tilde D^{-1/2} multiplies entry (i, j) by deg_inv_sqrt[i] * deg_inv_sqrt[j].
+# So instead of two sparse matrix products we scale the stored nonzeros
+# (A_tilde.data) directly, in one pass:
+# - A_rows holds the row of each nonzero (CSR stores rows as ranges via indptr)
+# - A_tilde.indices holds the column of each nonzero
+A_rows = np.repeat(np.arange(num_nodes), np.diff(A_tilde.indptr))
+A_tilde.data *= deg_inv_sqrt[A_rows] * deg_inv_sqrt[A_tilde.indices]
+A_norm = A_tilde
 
 # -----------------------------------------------------------------------------
 # Step 2: Convert data to PyTorch tensors
@@ -332,14 +378,47 @@ A_norm = D_inv_sqrt @ A_tilde @ D_inv_sqrt
 X_t = torch.tensor(X, dtype=torch.float32)
 y_t = torch.tensor(y, dtype=torch.long)
 
-# Convert A_norm to a torch sparse tensor
-A_norm_coo = A_norm.tocoo()
-A_indices = torch.tensor(
-    np.vstack((A_norm_coo.row, A_norm_coo.col)),
-    dtype=torch.long
+# Convert A_norm to a torch sparse tensor (CSR layout)
+# Scalability note:
+# - CSR stores each row's nonzeros contiguously (row pointers + column indices),
+#   which is the layout sparse-dense matrix multiplication reads fastest.
+# - A_norm is already CSR in SciPy, so we hand its three arrays straight to
+#   PyTorch (no conversion to COO and no coalescing step).
+A_norm.sort_indices()
+A_norm_t = torch.sparse_csr_tensor(
+    torch.from_numpy(A_norm.indptr).long(),
+    torch.from_numpy(A_norm.indices).long(),
+    torch.from_numpy(A_norm.data),
+    size=(num_nodes, num_nodes)
 )
-A_values = torch.tensor(A_norm_coo.data, dtype=torch.float32)
-A_norm_t = torch.sparse_coo_tensor(A_indices, A_values, size=(num_nodes, num_nodes)).coalesce()
+
+# Tensors made with torch.from_numpy never require gradients, so autograd does
+# not track A_norm. PyTorch's CPU kernels already split the work across one
+# thread per physical core (see torch.get_num_threads()); raising this to the
+# hyperthread count (os.cpu_count()) usually makes memory-bound kernels slower.
+
+# The same A_norm as an edge list (row, col, value).
+# In Step 4 we do message passing with these directly:
+# - F.embedding gathers each edge's source row (col) of the input (a row
+#   lookup, like index_select, with a dedicated fast kernel and gradient)
+# - multiply by the edge weight (value)
+# - index_add sums the weighted messages into each edge's target row (row)
+# Both steps have simple, fast gradients, so backward avoids the sparse-tensor
+# bookkeeping that torch.sparse.mm needs.
+#
+# The graph is undirected, so A_norm is symmetric: entry (i, j) equals (j, i).
+# We keep each edge once (row < col, the upper triangle) and send its message
+# both ways, plus the self-loops (the diagonal) separately. That halves the
+# indices and values stored and read.
+upper = A_rows < A_norm.indices
+A_row_t = torch.from_numpy(A_rows[upper])
+A_col_t = torch.from_numpy(A_norm.indices[upper]).long()
+
+# The edge weights stay in float32, the same values the training loop uses
+# (A_sub.data), so the reported accuracies come from the operator the model
+# was trained with.
+A_val_t = torch.from_numpy(A_norm.data[upper]).unsqueeze(1)
+A_diag_t = torch.from_numpy(A_norm.diagonal()).unsqueeze(1)
 
 train_idx_t = torch.tensor(train_idx, dtype=torch.long)
 val_idx_t   = torch.tensor(val_idx, dtype=torch.long)
@@ -356,39 +435,106 @@ lin2 = nn.Linear(hidden_dim, num_classes)
 
 optimizer = torch.optim.Adam(list(lin1.parameters()) + list(lin2.parameters()), lr=0.01, weight_decay=5e-4)
 
+# Scalability note:
+# - For long training runs, torch.compile can fuse the small per-step
+#   operations (linear, ReLU, message passing) into fewer compiled kernels.
+# - Compiling takes tens of seconds up front and recompiles for every new
+#   subgraph size, so it only pays off when training runs for minutes.
+#   This 30-epoch demo finishes in about a second, so we skip it here.
+
 # -----------------------------------------------------------------------------
-# Step 4: Training loop (explicit; prints each epoch)
+# Step 4: Training loop (explicit; prints every few epochs)
 # -----------------------------------------------------------------------------
-# We do 30 epochs to keep the output manageable in class.
+# We do 30 epochs and report accuracy every 5 to keep the output manageable in class.
 epochs = 30
+eval_every = 5
+
+# A_norm and X never change during training, so the first layer's message
+# passing (A_norm X) is computed once here. Since A_norm (X W0) = (A_norm X) W0,
+# the first layer becomes a plain linear layer on AX inside the loop, and each
+# step needs only one sparse multiplication (on the narrow num_classes-wide output).
+# Note: this slightly changes the model. lin1's bias b is now added after
+# aggregation, (A_norm X) W0 + b, instead of before it, A_norm (X W0 + b); the
+# two differ because the rows of A_norm do not sum to 1. Adding the bias after
+# aggregation is the standard GCN layer form.
+AX_t = torch.sparse.mm(A_norm_t, X_t)
+
+# Minibatches on subgraphs (scalability):
+# The loss only uses training nodes, so each update step only needs the part
+# of the graph around a batch of them:
+# - the batch nodes' rows of A_norm (who each batch node listens to)
+# - the hidden states of those neighbors (AX is precomputed, so a neighbor's
+#   hidden state depends on its own row of AX only)
+# Each epoch shuffles the training nodes and steps through them batch by batch.
+# On large graphs this keeps every step small, no matter how big the graph is.
+batch_size = 200
+
+# Reused every epoch when computing accuracy
+preds = torch.empty(num_nodes, dtype=torch.long)
+split_sizes_t = torch.tensor([train_size, val_size, test_size])
 
 for epoch in range(1, epochs + 1):
 
-    # Forward pass
-    H0 = lin1(X_t)
-    H1 = torch.sparse.mm(A_norm_t, H0)
-    H1 = torch.relu(H1)
+    batch_order = rng.permutation(train_idx)
+
+    # Sum of per-node losses over the epoch (weighted by batch size, so the
+    # smaller last batch counts less); detached so it adds nothing to backprop
+    epoch_loss_sum = torch.zeros(())
+
+    for start in range(0, train_size, batch_size):
+        batch = batch_order[start:start + batch_size]
 
-    Z0 = lin2(H1)
-    logits = torch.sparse.mm(A_norm_t, Z0)
+        # Subgraph: batch rows x neighbor columns of A_norm
+        A_batch = A_norm[batch]
+        nbrs = np.unique(A_batch.indices)
+        A_sub = A_batch[:, nbrs].tocoo()
 
-    # Loss on training nodes only
-    loss = F.cross_entropy(logits[train_idx_t], y_t[train_idx_t])
+        # Forward pass (neighbors only)
+        H1 = lin1(AX_t[nbrs])
+        H1 = torch.relu(H1)
 
-    # Backprop + update
-    optimizer.zero_grad()
-    loss.backward()
-    optimizer.step()
+        Z0 = lin2(H1)
+        messages = F.embedding(torch.from_numpy(A_sub.col).long(), Z0) * torch.from_numpy(A_sub.data).unsqueeze(1)
+        logits_batch = torch.zeros(len(batch), num_classes).index_add(0, torch.from_numpy(A_sub.row).long(), messages)
 
-    # Accuracy (train/val/test)
-    preds = torch.argmax(logits, dim=1)
+        # Loss on this batch of training nodes
+        loss = F.cross_entropy(logits_batch, y_t[batch])
+        epoch_loss_sum += loss.detach() * len(batch)
 
-    train_acc = (preds[train_idx_t] == y_t[train_idx_t]).float().mean().item()
-    val_acc   = (preds[val_idx_t]   == y_t[val_idx_t]).float().mean().item()
-    test_acc  = (preds[test_idx_t]  == y_t[test_idx_t]).float().mean().item()
+        # Backprop + update
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
 
-    print("Epoch", epoch, "| loss:", float(loss.detach().cpu().numpy()),
-          "| train_acc:", train_acc, "| val_acc:", val_acc, "| test_acc:", test_acc)
+    # Full-graph evaluation only every eval_every epochs (and after the last
+    # one): training itself never needs the val/test predictions
+    if epoch % eval_every == 0 or epoch == epochs:
+
+        # Full-graph forward pass for reporting (no gradients needed)
+        with torch.no_grad():
+            H1 = torch.relu(lin1(AX_t))
+            Z0 = lin2(H1)
+            logits = (
+                (Z0 * A_diag_t)
+                .index_add(0, A_row_t, F.embedding(A_col_t, Z0) * A_val_t)
+                .index_add(0, A_col_t, F.embedding(A_row_t, Z0) * A_val_t)
+            )
+
+        # Accuracy (train/val/test)
+        # argmax writes into the preallocated preds; one comparison marks every
+        # correct node, and the three accuracies come back to Python in one call.
+        torch.argmax(logits, dim=1, out=preds)
+        correct = preds.eq(y_t)
+
+        train_acc, val_acc, test_acc = (torch.stack([
+            correct[train_idx_t].sum(),
+            correct[val_idx_t].sum(),
+            correct[test_idx_t].sum(),
+        ]) / split_sizes_t).tolist()
+
+        # Mean training loss over all batches of this epoch
+        print("Epoch", epoch, "| loss:", (epoch_loss_sum / train_size).item(),
+              "| train_acc:", train_acc, "| val_acc:", val_acc, "| test_acc:", test_acc)
 
 # -----------------------------------------------------------------------------
 # Part 7: Post-Training Diagnostics (Confusion Matrix + Comparison)
@@ -408,9 +554,16 @@ print("\nModel comparison:")
 print("  Baseline LR test accuracy:", test_acc_lr)
 print("  GCN test accuracy:", test_acc_gcn)
 
-confusion_like = pd.crosstab(
-    pd.Series(test_truth, name="True"),
-    pd.Series(test_pred_gcn, name="Predicted")
+# Count (true, predicted) pairs in one pass: each pair gets the cell number
+# true * num_classes + predicted, and bincount counts every cell at once.
+confusion_counts = np.bincount(
+    test_truth * num_classes + test_pred_gcn, minlength=num_classes * num_classes
+).reshape(num_classes, num_classes)
+
+confusion_like = pd.DataFrame(
+    confusion_counts,
+    index=pd.Index(np.arange(num_classes), name="True"),
+    columns=pd.Index(np.arange(num_classes), name="Predicted")
 )
 
 print("\nGCN confusion table (test set):")
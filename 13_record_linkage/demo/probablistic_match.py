@@ -21,14 +21,15 @@
 # Setup
 # -----------------------------------------------------------------------------
 # If you do not have these installed, run (in Terminal / Anaconda Prompt):
-#   pip install pandas numpy matplotlib recordlinkage rapidfuzz
+#   pip install pandas numpy matplotlib recordlinkage "rapidfuzz>=3.6"
 
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
 import recordlinkage as rl
-from rapidfuzz.distance import Levenshtein
+from rapidfuzz import process
+from rapidfuzz.distance import JaroWinkler, Levenshtein
 
 from datetime import date
 
@@ -76,40 +77,69 @@ mod_firstname = np.random.rand(len(df_b)) < 0.25
 mod_lastname  = np.random.rand(len(df_b)) < 0.25
 mod_birthyear = np.random.rand(len(df_b)) < 0.25
 
+# How the typos are made (the same recipe for every selected name, done for all
+# selected names at once with NumPy arrays instead of a loop over rows):
+# - split each name into a grid of single characters (one row per name,
+#   padded on the right up to the longest name)
+# - pick how many characters to replace: 1 up to the name's length
+# - pick WHICH characters: give each real character a random number and
+#   replace the ones with the smallest numbers (a random subset of that size)
+# - replace them with random lowercase letters, then glue the rows back into names
+
+alphabet = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+
 # ---- 2A: Add typos to FIRST NAMES (only for rows selected by mod_firstname) ----
 idx_firstname = np.where(mod_firstname)[0]
 
-for i in idx_firstname:
-    firstname = df_b.loc[i, "firstname"]
-    chars = list(firstname)
+firstnames = df_b.loc[idx_firstname, "firstname"].to_numpy().astype(str)
+lengths = np.char.str_len(firstnames)
+max_len = lengths.max()
+
+chars = firstnames.astype(f"U{max_len}").view("U1").reshape(len(firstnames), max_len)
+in_name = np.arange(max_len) < lengths[:, None]
 
-    num_replace = np.random.randint(1, len(chars) + 1)
-    positions = np.random.choice(np.arange(len(chars)), size=num_replace, replace=False)
+num_replace = np.random.randint(1, lengths + 1)
+position_keys = np.where(in_name, np.random.rand(len(firstnames), max_len), 2.0)
+position_ranks = position_keys.argsort(axis=1).argsort(axis=1)
+replace = position_ranks < num_replace[:, None]
 
-    for pos in positions:
-        chars[pos] = np.random.choice(list("abcdefghijklmnopqrstuvwxyz"))
+letters = np.random.choice(alphabet, size=(len(firstnames), max_len))
+chars = np.where(replace, letters, chars)
 
-    df_b.loc[i, "firstname"] = "".join(chars)
+# Write the new names into a copy of the whole column, then replace the column
+# in one assignment (cheaper than updating the DataFrame cell by cell)
+new_firstnames = df_b["firstname"].to_numpy().copy()
+new_firstnames[idx_firstname] = chars.view(f"U{max_len}").ravel()
+df_b["firstname"] = new_firstnames
 
 # ---- 2B: Add typos to LAST NAMES (only for rows selected by mod_lastname) ----
 idx_lastname = np.where(mod_lastname)[0]
 
-for i in idx_lastname:
-    lastname = df_b.loc[i, "lastname"]
-    chars = list(lastname)
+lastnames = df_b.loc[idx_lastname, "lastname"].to_numpy().astype(str)
+lengths = np.char.str_len(lastnames)
+max_len = lengths.max()
 
-    num_replace = np.random.randint(1, len(chars) + 1)
-    positions = np.random.choice(np.arange(len(chars)), size=num_replace, replace=False)
+chars = lastnames.astype(f"U{max_len}").view("U1").reshape(len(lastnames), max_len)
+in_name = np.arange(max_len) < lengths[:, None]
 
-    for pos in positions:
-        chars[pos] = np.random.choice(list("abcdefghijklmnopqrstuvwxyz"))
+num_replace = np.random.randint(1, lengths + 1)
+position_keys = np.where(in_name, np.random.rand(len(lastnames), max_len), 2.0)
+position_ranks = position_keys.argsort(axis=1).argsort(axis=1)
+replace = position_ranks < num_replace[:, None]
 
-    df_b.loc[i, "lastname"] = "".join(chars)
+letters = np.random.choice(alphabet, size=(len(lastnames), max_len))
+chars = np.where(replace, letters, chars)
+
+new_lastnames = df_b["lastname"].to_numpy().copy()
+new_lastnames[idx_lastname] = chars.view(f"U{max_len}").ravel()
+df_b["lastname"] = new_lastnames
 
 # ---- 2C: Shift BIRTH YEAR slightly (only for rows selected by mod_birthyear) ----
 idx_birthyear = np.where(mod_birthyear)[0]
 birthyear_shift = np.random.choice(np.arange(-2, 3), size=len(idx_birthyear), replace=True)
-df_b.loc[idx_birthyear, "birthyear"] = df_b.loc[idx_birthyear, "birthyear"].to_numpy() + birthyear_shift
+new_birthyears = df_b["birthyear"].to_numpy().copy()
+new_birthyears[idx_birthyear] = new_birthyears[idx_birthyear] + birthyear_shift
+df_b["birthyear"] = new_birthyears
 
 # -----------------------------------------------------------------------------
 # Step 3: Save datasets to CSV (so students can load them like "real" files)
@@ -134,6 +164,10 @@ df_b = pd.read_csv("dataset_b.csv")
 df_a = df_a.set_index("id")
 df_b = df_b.set_index("id")
 
+# Copies with id as an ordinary column, made once and reused by the merges below
+df_a_flat = df_a.reset_index()
+df_b_flat = df_b.reset_index()
+
 # -----------------------------------------------------------------------------
 # Step 2: Examine the datasets
 # -----------------------------------------------------------------------------
@@ -153,15 +187,32 @@ print(df_b.head())
 # - A record in df_a matches a record in df_b ONLY IF all chosen fields match exactly.
 #
 # In pandas, merge(..., on=[...]) is a standard exact-match join.
+#
+# Speed-up: instead of joining on four columns, we give every distinct
+# combination of the four fields one integer id and join on that single column.
+# - stack df_a and df_b so the same combination gets the same id in both
+# - groupby(...).ngroup() numbers the groups 0, 1, 2, ...; two records get the
+#   same id exactly when all four fields are equal (no packing, so no collisions)
+# - dropna=False keeps missing values as their own group, so they still match
+#   each other the way merge(on=[...]) matches them
+n_a = len(df_a_flat)
+
+match_key = (
+    pd.concat([df_a_flat, df_b_flat], ignore_index=True)
+      .groupby(["firstname", "lastname", "birthyear", "zipcode"], dropna=False, sort=False)
+      .ngroup()
+      .to_numpy()
+)
 
 det_matches = (
-    df_a.reset_index()
+    df_a_flat.assign(match_key=match_key[:n_a])
       .merge(
-          df_b.reset_index(),
-          on=["firstname", "lastname", "birthyear", "zipcode"],
+          df_b_flat[["id"]].assign(match_key=match_key[n_a:]),
+          on="match_key",
           how="inner",
           suffixes=(".a", ".b")
       )
+      .drop(columns=["match_key"])
 )
 
 print("Number of deterministic matches:", det_matches.shape[0])
@@ -185,10 +236,24 @@ print("Number of deterministic matches:", det_matches.shape[0])
 # -----------------------------------------------------------------------------
 # Blocking reduces the number of candidate pairs we consider.
 # Here we block on zipcode (exact), because zipcode has no noise in our toy data.
+#
+# Zipcode alone still pairs every record with every other record in its
+# zipcode. So we block on zipcode PLUS one more field, in three passes, and keep
+# a pair if ANY pass finds it (rl.Index combines the passes as a union):
+# - zipcode + first letter of the last name
+# - zipcode + first letter of the first name
+# - zipcode + birthyear
+# A true match is only lost if typos hit BOTH initials AND its birthyear was
+# shifted, which is rare; most non-matches fail all three passes.
+# The initials go in separate blocking copies, so df_a/df_b keep their columns.
+df_a_block = df_a.assign(firstname_initial=df_a["firstname"].str[0], lastname_initial=df_a["lastname"].str[0])
+df_b_block = df_b.assign(firstname_initial=df_b["firstname"].str[0], lastname_initial=df_b["lastname"].str[0])
 
 indexer = rl.Index()
-indexer.block("zipcode")
-candidate_pairs = indexer.index(df_a, df_b)
+indexer.block(["zipcode", "lastname_initial"])
+indexer.block(["zipcode", "firstname_initial"])
+indexer.block(["zipcode", "birthyear"])
+candidate_pairs = indexer.index(df_a_block, df_b_block)
 
 print("Number of candidate pairs after blocking:", len(candidate_pairs))
 
@@ -200,16 +265,31 @@ print("Number of candidate pairs after blocking:", len(candidate_pairs))
 # - firstname similarity (Jaro-Winkler)
 # - lastname similarity (Jaro-Winkler)
 # - birthyear similarity (Gaussian similarity around equality)
-# - zipcode exact match (should mostly be 1 due to blocking, but we keep it explicit)
-
+# - zipcode exact match (always 1: blocking only pairs records with the same
+#   zipcode, so we set it directly instead of comparing every pair)
+#
+# Speed-up for the name similarities: we look up both names of every candidate
+# pair (candidate_pairs holds (id in df_a, id in df_b)) and score them all at
+# once with RapidFuzz's Jaro-Winkler (compiled code, all CPU cores), then add
+# the results as columns, named as compare.string(..., label=...) would name them.
 compare = rl.Compare()
-compare.string("firstname", "firstname", method="jarowinkler", label="firstname_sim")
-compare.string("lastname",  "lastname",  method="jarowinkler", label="lastname_sim")
 compare.numeric("birthyear", "birthyear", method="gauss", offset=0, scale=2, label="birthyear_sim")
-compare.exact("zipcode", "zipcode", label="zipcode_exact")
 
 features = compare.compute(candidate_pairs, df_a, df_b)
 
+pair_names_a = df_a.reindex(candidate_pairs.get_level_values(0))
+pair_names_b = df_b.reindex(candidate_pairs.get_level_values(1))
+
+features.insert(0, "firstname_sim", process.cpdist(
+    pair_names_a["firstname"], pair_names_b["firstname"],
+    scorer=JaroWinkler.normalized_similarity, dtype=np.float64, workers=-1
+))
+features.insert(1, "lastname_sim", process.cpdist(
+    pair_names_a["lastname"], pair_names_b["lastname"],
+    scorer=JaroWinkler.normalized_similarity, dtype=np.float64, workers=-1
+))
+features["zipcode_exact"] = 1
+
 print(features.head())
 
 # -----------------------------------------------------------------------------
@@ -240,9 +320,10 @@ print(posterior_df.head())
 
 threshold_grid = np.arange(0, 1.01, 0.01)
 
-match_counts = []
-for th in threshold_grid:
-    match_counts.append((posterior >= th).sum())
+# Sort the posteriors once; for each threshold, searchsorted finds how many
+# pairs fall below it, and the rest are the matches (posterior >= threshold).
+sorted_posterior = np.sort(posterior.to_numpy())
+match_counts = len(sorted_posterior) - np.searchsorted(sorted_posterior, threshold_grid, side="left")
 
 count_of_matches = pd.DataFrame({
     "threshold": threshold_grid,
@@ -283,40 +364,41 @@ bin_labels = [
     "0.5-0.6", "0.6-0.7", "0.7-0.8", "0.8-0.9", "0.9-1.0"
 ]
 
-matches_low["threshold_bin"] = pd.cut(
-    matches_low["posterior"],
-    bins=bin_edges,
-    labels=bin_labels,
-    right=True
-)
+# Bin number (0-9) for each pair: searchsorted finds where each posterior falls
+# among the bin edges (side="left" puts a value equal to an edge in the bin
+# that edge closes, like (0.1, 0.2]). from_codes then attaches the labels to
+# these small integer codes without building or comparing any strings.
+bin_codes = np.searchsorted(bin_edges, matches_low["posterior"].to_numpy(), side="left") - 1
 
-# Join pair rows back to df_a and df_b so we can compare fields
-pairs_plus_a = matches_low.merge(df_a.reset_index(), left_on="id_a", right_on="id", how="left")
-pairs_plus_a = pairs_plus_a.drop(columns=["id"]).rename(columns={
-    "firstname": "firstname_a",
-    "lastname": "lastname_a",
-    "birthyear": "birthyear_a",
-    "zipcode": "zipcode_a"
-})
+matches_low["threshold_bin"] = pd.Categorical.from_codes(bin_codes, categories=bin_labels, ordered=True)
 
-pairs_plus_ab = pairs_plus_a.merge(df_b.reset_index(), left_on="id_b", right_on="id", how="left")
-pairs_plus_ab = pairs_plus_ab.drop(columns=["id"]).rename(columns={
-    "firstname": "firstname_b",
-    "lastname": "lastname_b",
-    "birthyear": "birthyear_b",
-    "zipcode": "zipcode_b"
-})
+# Attach each pair's df_a and df_b fields so we can compare them.
+# df_a and df_b are indexed by id, so reindex() looks the rows up directly by
+# id_a / id_b (one row per pair, in pair order); add_suffix() names the columns
+# firstname_a, ..., zipcode_b. No merge, drop, or rename needed.
+pairs_a = df_a.reindex(matches_low["id_a"].to_numpy()).add_suffix("_a").reset_index(drop=True)
+pairs_b = df_b.reindex(matches_low["id_b"].to_numpy()).add_suffix("_b").reset_index(drop=True)
+
+pairs_plus_ab = pd.concat([matches_low.reset_index(drop=True), pairs_a, pairs_b], axis=1)
 
 # Compute string distances (Levenshtein edit distance)
-pairs_plus_ab["first_name_distance"] = [
-    Levenshtein.distance(a, b) for a, b in zip(pairs_plus_ab["firstname_a"], pairs_plus_ab["firstname_b"])
-]
-pairs_plus_ab["last_name_distance"] = [
-    Levenshtein.distance(a, b) for a, b in zip(pairs_plus_ab["lastname_a"], pairs_plus_ab["lastname_b"])
-]
+# process.cpdist compares the two columns element by element (row 1 with row 1,
+# row 2 with row 2, ...) in compiled code, using all CPU cores (workers=-1).
+# By default it returns unsigned integers (uint32), where subtracting past zero
+# wraps around to huge values; dtype=np.int32 asks for signed integers instead.
+pairs_plus_ab["first_name_distance"] = process.cpdist(
+    pairs_plus_ab["firstname_a"], pairs_plus_ab["firstname_b"], scorer=Levenshtein.distance, dtype=np.int32, workers=-1
+)
+pairs_plus_ab["last_name_distance"] = process.cpdist(
+    pairs_plus_ab["lastname_a"], pairs_plus_ab["lastname_b"], scorer=Levenshtein.distance, dtype=np.int32, workers=-1
+)
 
 # Compute birthyear distance: absolute difference
-pairs_plus_ab["birth_year_distance"] = (pairs_plus_ab["birthyear_a"] - pairs_plus_ab["birthyear_b"]).abs()
+# Years fit easily in int16 (2 bytes instead of 8), and plain NumPy arrays skip
+# pandas' per-operation overhead.
+birthyear_a = pairs_plus_ab["birthyear_a"].to_numpy(dtype=np.int16)
+birthyear_b = pairs_plus_ab["birthyear_b"].to_numpy(dtype=np.int16)
+pairs_plus_ab["birth_year_distance"] = np.abs(birthyear_a - birthyear_b)
 
 # Average distance by posterior bin (mean distances + counts)
 avg_dist_by_bin = (